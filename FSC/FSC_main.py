@@ -1,22 +1,28 @@
 import itertools
 import os
 import json
-import pickle
 import pandas as pd
 import random
 import copy
 import numpy as np
-from semspaces.space import SemanticSpace
+from binary_space import load_space
 from datetime import datetime
 from celex import get_celex_coverage
-from neighbors import get_levenshtein_neighbours
-from fsc_ld import levenshtein_fsc #use fsc_ld_linux if not working on windows
-from semantic import neighborhood_density
+from neighbors import LevenshteinIndex, levenshtein_neighbourhoods
+from fsc_ld import levenshtein_fsc
+from semantic import semantic_neighborhood_densities
+from shared_space import SharedSpace
+from stage_cache import StageCache
 from resources import aoa, concreteness, valence, morpholex
-from compute_old20 import calculate_old20
 
 force_recomputation = False
 random_baseline = True
+#the maximum size of the cache of stage results (see stage_cache.py), the results used least recently are deleted first
+cache_size = 5 * 1024 ** 3
+#the number of semantic neighbours (SND), of Levenshtein neighbours (FSC) and of the closest forms (old20) considered
+n_neighbors = 20
+k = 20
+n_old = 20
 
 def read(path):
 
@@ -204,13 +210,13 @@ if __name__ == '__main__':
     #Loading the data
     print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started loading the data... \n"))
 
-    embedding_space = SemanticSpace.from_csv(embedding_space_file, prenorm=True)
+    embedding_space = load_space(embedding_space_file, prenorm=True)
     w2v_words = embedding_space.included_words()
 
-    reference_space = SemanticSpace.from_csv(reference_space_file, prenorm = True)
+    reference_space = load_space(reference_space_file, prenorm = True)
     w2v_reference = reference_space.included_words()
 
-    child_produced_space = SemanticSpace.from_csv(child_produced_space_file, prenorm = True)
+    child_produced_space = load_space(child_produced_space_file, prenorm = True)
     w2v_child_produced = child_produced_space.included_words()
 
     celex = json.load(open(celex_file))
@@ -274,106 +280,97 @@ if __name__ == '__main__':
     print('The child-produced reference vocabulary for retrieving form-based neighbors consists of {} words.'.format(len(produced_reference_vocab)))
     print('The most used reference vocabulary for retrieving form-based neighbors consists of {} words.'.format(len(most_used_reference_vocab)))
 
-    #Compute semantic neighborhood density
-    fullsndfile = "fulltarget2snd" + str(age_bin) + ".json"
-    snd_path = os.path.join(fsc_dir, fullsndfile)
-    try:
-        if force_recomputation:
-            raise FileNotFoundError()
-        full_t2snd = json.load(open(snd_path, "rb"))
-        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File {} found and loaded.".format(snd_path)))
-    except FileNotFoundError:
-        full_t2snd = neighborhood_density(embedding_space, reference_space, target_vocab, full_reference_vocab)
-        json.dump(full_t2snd, open(snd_path, 'w'))
-
-    producedsndfile = "childproducedtarget2snd" + str(age_bin) + ".json"
-    produced_snd_path = os.path.join(fsc_dir, producedsndfile)
-    try:
-        if force_recomputation:
-            raise FileNotFoundError()
-        produced_t2snd = json.load(open(produced_snd_path, "rb"))
-        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File {} found and loaded.".format(produced_snd_path)))
-    except FileNotFoundError:
-        produced_t2snd = neighborhood_density(embedding_space, reference_space, target_vocab, produced_reference_vocab)
-        json.dump(produced_t2snd, open(produced_snd_path, 'w'))
-
-    mostsndfile = "mostusedtarget2snd" + str(age_bin) + ".json"
-    most_snd_path = os.path.join(fsc_dir, mostsndfile)
-    try:
-        if force_recomputation:
-            raise FileNotFoundError()
-        most_t2snd = json.load(open(most_snd_path, "rb"))
-        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File {} found and loaded.".format(most_snd_path)))
-    except FileNotFoundError:
-        most_t2snd = neighborhood_density(embedding_space, reference_space, target_vocab, most_used_reference_vocab)
-        json.dump(most_t2snd, open(most_snd_path, 'w'))
-
-    #compute old20 values for each word
-    print(
-        datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started computing old20 values for all words.")
-    )
-    full_old20 = calculate_old20(target_vocab, full_reference_vocab)
-    produced_old20 = calculate_old20(target_vocab, produced_reference_vocab)
-    most_old20 = calculate_old20(target_vocab, most_used_reference_vocab)
-    print(
-        datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done computing old20 values for all words.")
-    )
-
-    
-    #find neighbors (levenshstein) for orthographic froms
-    print(
-        datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started retrieving Levenshtein distance neighbors for orthographic forms.")
-    )
-    full_ortho2neighbors_ld = get_levenshtein_neighbours(target_vocab, full_reference_vocab)
-    produced_ortho2neighbors_ld = get_levenshtein_neighbours(target_vocab, produced_reference_vocab)
-    most_ortho2neighbors_ld = get_levenshtein_neighbours(target_vocab, most_used_reference_vocab)
-    print(
-        datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done retrieving Levenshtein distance neighbors for orthographic forms.")
-    )
-    
+    #Results of the expensive stages are stored in a cache keyed on the content of their inputs (spaces, vocabularies
+    #and parameters), so that a stage is only recomputed when one of its inputs changed
+    cache = StageCache(os.path.join(fsc_dir, "stage_cache"), max_bytes=cache_size, force_recomputation=force_recomputation)
+    reference_vocabs = [full_reference_vocab, produced_reference_vocab, most_used_reference_vocab]
+
+    #Try to fetch the SND values for the full, child-produced and most used reference vocabularies from the cache, the
+    #ones which are missing are computed together from a single similarity pass
+    snd_keys = [
+        cache.key("snd", embeddings=embedding_space, reference=reference_space, targets=target_vocab,
+                  reference_vocab=set(reference_vocab), n_neighbors=n_neighbors)
+        for reference_vocab in reference_vocabs
+    ]
+    snd_values = [cache.load(key) for key in snd_keys]
+
+    missing_snd = [j for j, values in enumerate(snd_values) if values is None]
+    if missing_snd:
+        #The vectors are copied into shared memory once for this age bin, so that the workers of the computations
+        #below attach to them by name instead of receiving a pickled copy
+        with SharedSpace.from_space(embedding_space) as embedding_store, SharedSpace.from_space(reference_space) as reference_store:
+            computed_snd = semantic_neighborhood_densities(
+                embedding_store, reference_store, target_vocab, [reference_vocabs[j] for j in missing_snd],
+                n_neighbors=n_neighbors
+            )
+        for j, values in zip(missing_snd, computed_snd):
+            snd_values[j] = values
+            cache.store(snd_keys[j], values)
+
+    full_t2snd, produced_t2snd, most_t2snd = snd_values
+
+    #Try to fetch the Levenshtein neighbors and old20 values for the full, child-produced and most used reference
+    #vocabularies from the cache. The neighbours of the ones which are missing are found together, from the same
+    #distances
+    neighbour_keys = [
+        cache.key("levenshtein_neighbours", targets=target_vocab, reference_vocab=set(reference_vocab), k=k, n_old=n_old)
+        for reference_vocab in reference_vocabs
+    ]
+    neighbourhoods = [cache.load(key) for key in neighbour_keys]
+
+    missing_neighbourhoods = [j for j, values in enumerate(neighbourhoods) if values is None]
+    if missing_neighbourhoods:
+        #Try to fetch the Levenshtein index of the reference vocabulary from file: the index is shared by all age bins
+        #whose output is stored in the same map, and only words which were not indexed yet are added to it
+        index_path = os.path.join(fsc_dir, "levenshtein_index_ortho.pkl")
+        if os.path.exists(index_path):
+            ortho_index = LevenshteinIndex.load(index_path)
+            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File {} found and loaded.".format(index_path)))
+        else:
+            ortho_index = LevenshteinIndex()
+        n_indexed = len(ortho_index.words)
+        ortho_index.add(full_reference_vocab)
+        if len(ortho_index.words) > n_indexed:
+            ortho_index.save(index_path)
+
+        #find neighbors (levenshstein) for orthographic froms and compute old20 values for each word
+        print(
+            datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started retrieving Levenshtein distance neighbors and old20 values for orthographic forms.")
+        )
+        computed_neighbourhoods = levenshtein_neighbourhoods(
+            ortho_index, target_vocab, [reference_vocabs[j] for j in missing_neighbourhoods], k=k, n_old=n_old
+        )
+        for j, values in zip(missing_neighbourhoods, computed_neighbourhoods):
+            neighbourhoods[j] = values
+            cache.store(neighbour_keys[j], values)
+        print(
+            datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done retrieving Levenshtein distance neighbors and old20 values for orthographic forms.")
+        )
 
-    #Try to fetch FSC values (ortho, computed using Levenshtein distance, neighbors) from file. If the file does not exist, compute values
-    full_ldfile = "full_OSC_ld" + str(age_bin) + ".pkl"
-    osc_ld_path = os.path.join(fsc_dir, full_ldfile)
-    try:
-        if force_recomputation:
-            raise FileNotFoundError()
-        full_t2OSC_ld = pickle.load(open(osc_ld_path, "rb"))
-        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File found and loaded."))
-    except FileNotFoundError:
-        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started computing Levenshtein OSC..."))
-        full_t2OSC_ld = levenshtein_fsc(full_ortho2neighbors_ld, embedding_space, reference_space)
-        pickle.dump(full_t2OSC_ld, open(osc_ld_path, "wb"))
-        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done."))
-        print()
+    (full_ortho2neighbors_ld, full_old20), (produced_ortho2neighbors_ld, produced_old20), (most_ortho2neighbors_ld, most_old20) = \
+        neighbourhoods
 
-    produced_ldfile = "produced_OSC_ld" + str(age_bin) + ".pkl"
-    produced_osc_ld_path = os.path.join(fsc_dir, produced_ldfile)
-    try:
-        if force_recomputation:
-            raise FileNotFoundError()
-        produced_t2OSC_ld = pickle.load(open(produced_osc_ld_path, "rb"))
-        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File found and loaded."))
-    except FileNotFoundError:
+    #Try to fetch FSC values (ortho, computed using Levenshtein distance, neighbors) from the cache. The neighbours they
+    #are computed from are identified by the key they are stored under. If they are not found, compute values
+    def compute_osc(ortho2neighbors_ld):
         print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started computing Levenshtein OSC..."))
-        produced_t2OSC_ld = levenshtein_fsc(produced_ortho2neighbors_ld, embedding_space, reference_space)
-        pickle.dump(produced_t2OSC_ld, open(produced_osc_ld_path, "wb"))
+        t2OSC_ld = levenshtein_fsc(ortho2neighbors_ld, embedding_space, reference_space)
         print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done."))
         print()
+        return t2OSC_ld
 
-    most_ldfile = "mostused_OSC_ld" + str(age_bin) + ".pkl"
-    most_osc_ld_path = os.path.join(fsc_dir, most_ldfile)
-    try:
-        if force_recomputation:
-            raise FileNotFoundError()
-        most_t2OSC_ld = pickle.load(open(most_osc_ld_path, "rb"))
-        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File found and loaded."))
-    except FileNotFoundError:
-        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started computing Levenshtein OSC..."))
-        most_t2OSC_ld = levenshtein_fsc(most_ortho2neighbors_ld, embedding_space, reference_space)
-        pickle.dump(most_t2OSC_ld, open(most_osc_ld_path, "wb"))
-        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done."))
-        print()
+    full_t2OSC_ld, _ = cache.cached(
+        "OSC_ld", lambda: compute_osc(full_ortho2neighbors_ld),
+        neighbours=neighbour_keys[0], embeddings=embedding_space, reference=reference_space
+    )
+    produced_t2OSC_ld, _ = cache.cached(
+        "OSC_ld", lambda: compute_osc(produced_ortho2neighbors_ld),
+        neighbours=neighbour_keys[1], embeddings=embedding_space, reference=reference_space
+    )
+    most_t2OSC_ld, _ = cache.cached(
+        "OSC_ld", lambda: compute_osc(most_ortho2neighbors_ld),
+        neighbours=neighbour_keys[2], embeddings=embedding_space, reference=reference_space
+    )
 
     #write measures to file for subsequent analysis
     measure = "FSC"
@@ -1,17 +1,17 @@
 from old20 import old_n
 
-def calculate_old20(target_words, reference_words):
+def calculate_old20(target_words, reference_words, n=20):
 
     """
     :param target_words:    list, target words for which to compute old20.
     :param reference_words: list, reference vocabulary listing words to consider as valid neighbors.
-    :param threads:         int, the number of cores to use for parallel processing.
+    :param n:               int, the number of nearest neighbours to average over (20 for old20).
     :return:                dict, mapping words to their respective old20 values.
     """
 
     target_words = list(target_words)
 
-    value_old20 = old_n(target_words, reference_words, n=20)
+    value_old20 = old_n(target_words, reference_words, n=n)
 
     value_old20 = list(value_old20)
 
@@ -0,0 +1,191 @@
+import numpy as np
+from collections import defaultdict
+
+
+"""
+This module computes form-semantic consistency values for a whole batch of target words at once: all target and
+neighbour rows are gathered into integer arrays, the corresponding prenormalised vectors are pulled out of the semantic
+spaces as contiguous matrices and every weighted similarity is computed in a single NumPy pass.
+"""
+
+
+def gather_fsc_indices(targets2neighbors, target_word2row, reference_word2row):
+
+    """
+    :param targets2neighbors:   dict, mapping target words to lists of (neighbour, levenshtein distance) tuples
+    :param target_word2row:     dict, mapping words in the target space to their row index
+    :param reference_word2row:  dict, mapping words in the reference space to their row index
+    :return targets:            list, target words in the order used by all the returned arrays
+    :return target_rows:        NumPy 1d array, row index of each target word in the target space
+    :return neighbour_rows:     NumPy 1d array, row index of each (target, neighbour) pair in the reference space
+    :return lev_dis:            NumPy 1d array, levenshtein distance of each (target, neighbour) pair
+    :return segments:           NumPy 1d array, position in targets of the target each pair belongs to
+    :return den:                NumPy 1d array, number of neighbours of each target word
+
+    Neighbours which are not in the reference space are skipped, but they still count towards the denominator, as they
+    did when every pair was processed on its own.
+    """
+
+    targets = list(targets2neighbors)
+    target_rows = np.empty(len(targets), dtype=np.int64)
+    den = np.empty(len(targets), dtype=np.float64)
+
+    neighbour_rows = []
+    lev_dis = []
+    segments = []
+
+    for i, target in enumerate(targets):
+        neighbors = targets2neighbors[target]
+        target_rows[i] = target_word2row[target]
+        den[i] = len(neighbors)
+        for n, dis in neighbors:
+            row = reference_word2row.get(n)
+            if row is None:
+                continue
+            neighbour_rows.append(row)
+            lev_dis.append(dis)
+            segments.append(i)
+
+    return (targets, target_rows, np.array(neighbour_rows, dtype=np.int64), np.array(lev_dis, dtype=np.float64),
+            np.array(segments, dtype=np.int64), den)
+
+
+def batch_fsc(target_matrix, reference_matrix, target_rows, neighbour_rows, lev_dis, segments, den, chunk_size=1000000):
+
+    """
+    :param target_matrix:       NumPy 2d array, prenormalised vectors of the target space
+    :param reference_matrix:    NumPy 2d array, prenormalised vectors of the reference space
+    :param target_rows:         NumPy 1d array, see gather_fsc_indices
+    :param neighbour_rows:      NumPy 1d array, see gather_fsc_indices
+    :param lev_dis:             NumPy 1d array, see gather_fsc_indices
+    :param segments:            NumPy 1d array, see gather_fsc_indices
+    :param den:                 NumPy 1d array, see gather_fsc_indices
+    :param chunk_size:          int, maximum number of (target, neighbour) pairs whose vectors are gathered at once
+    :return:                    NumPy 1d array, the form-semantic consistency value of each target word. Targets without
+                                any neighbour get NaN
+    """
+
+    num = np.zeros(len(den), dtype=np.float64)
+
+    for start in range(0, len(segments), chunk_size):
+        stop = start + chunk_size
+        chunk_segments = segments[start:stop]
+        # since the vectors are prenormalised, the cosine similarity reduces to a row-wise dot product
+        sims = np.einsum(
+            'ij,ij->i', target_matrix[target_rows[chunk_segments]], reference_matrix[neighbour_rows[start:stop]]
+        )
+        num += np.bincount(chunk_segments, weights=np.abs(sims) / lev_dis[start:stop], minlength=len(den))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return num / den
+
+
+def random_permutations(n_rows, seeds):
+
+    """
+    :param n_rows:  int, number of rows to permute
+    :param seeds:   iterable, one random seed for each permutation
+    :return:        NumPy 2d array, one permutation of range(n_rows) for each seed, i.e. the permutation
+                    np.random.permutation returns after np.random.seed(seed)
+    """
+
+    return np.stack([np.random.RandomState(seed).permutation(n_rows) for seed in seeds])
+
+
+def permutation_batch_fsc(target_matrix, reference_matrix, target_rows, neighbour_rows, lev_dis, segments, den,
+                          permutations, chunk_size=256):
+
+    """
+    :param target_matrix:       NumPy 2d array, prenormalised vectors of the target space
+    :param reference_matrix:    NumPy 2d array, prenormalised vectors of the reference space
+    :param target_rows:         NumPy 1d array, see gather_fsc_indices
+    :param neighbour_rows:      NumPy 1d array, see gather_fsc_indices
+    :param lev_dis:             NumPy 1d array, see gather_fsc_indices
+    :param segments:            NumPy 1d array, see gather_fsc_indices
+    :param den:                 NumPy 1d array, see gather_fsc_indices
+    :param permutations:        NumPy 2d array, each row a permutation of the rows of reference_matrix, see
+                                random_permutations: under permutation p, the word stored in row r of the reference
+                                space is paired with the vector reference_matrix[permutations[p, r]]
+    :param chunk_size:          int, number of target words processed at once
+    :return:                    NumPy 2d array of shape (n_permutations, n_targets), the form-semantic consistency value
+                                of each target word under each permutation. Targets without any neighbour get NaN
+
+    The neighbours of each target and their Levenshtein weights do not depend on the permutation, so for each chunk of
+    targets the similarities to every reference vector are computed once: each permutation then reduces to gathering
+    those similarities through its permuted neighbour rows, and all permutations are gathered together.
+    """
+
+    n_permutations, n_targets = len(permutations), len(den)
+    num = np.zeros((n_permutations, n_targets), dtype=np.float64)
+    # pairs are grouped by target, so the pairs of a chunk of targets are a contiguous slice
+    bounds = np.searchsorted(segments, np.arange(0, n_targets + chunk_size, chunk_size))
+
+    for c, start in enumerate(range(0, n_targets, chunk_size)):
+        lo, hi = bounds[c], bounds[c + 1]
+        if lo == hi:
+            continue
+        n_chunk = min(chunk_size, n_targets - start)
+        sims = np.dot(target_matrix[target_rows[start:start + n_chunk]], reference_matrix.T)
+        local_segments = segments[lo:hi] - start
+        weighted = np.abs(sims[local_segments, permutations[:, neighbour_rows[lo:hi]]]) / lev_dis[lo:hi]
+        # offset the target of each pair by permutation, so that a single bincount sums all permutations
+        bins = local_segments + n_chunk * np.arange(n_permutations)[:, None]
+        num[:, start:start + n_chunk] = np.bincount(
+            bins.ravel(), weights=weighted.ravel(), minlength=n_permutations * n_chunk
+        ).reshape(n_permutations, n_chunk)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return num / den
+
+
+def batch_levenshtein_fsc(targets2neighbors, embedding_space, reference_space):
+
+    """
+    :param targets2neighbors:   dict, mapping target words to lists of (neighbour, levenshtein distance) tuples
+    :param embedding_space:     SemanticSpace object containing the prenormalised semantic embeddings of the targets
+    :param reference_space:     SemanticSpace object containing the prenormalised semantic embeddings of the reference
+                                vocabulary
+    :return:                    dict, target words mapped to form-semantic consistency values
+    """
+
+    targets, target_rows, neighbour_rows, lev_dis, segments, den = gather_fsc_indices(
+        targets2neighbors, embedding_space.word2id, reference_space.word2id
+    )
+    fsc = batch_fsc(
+        np.ascontiguousarray(embedding_space.vectors), np.ascontiguousarray(reference_space.vectors),
+        target_rows, neighbour_rows, lev_dis, segments, den
+    )
+
+    t2fsc = defaultdict(int)
+    for target, value in zip(targets, fsc):
+        t2fsc[target] = float(value)
+
+    return t2fsc
+
+
+def permutation_levenshtein_fsc(targets2neighbors, embedding_space, reference_space, permutations, chunk_size=256):
+
+    """
+    :param targets2neighbors:   dict, mapping target words to lists of (neighbour, levenshtein distance) tuples
+    :param embedding_space:     SemanticSpace object containing the prenormalised semantic embeddings of the targets
+    :param reference_space:     SemanticSpace object containing the prenormalised semantic embeddings of the reference
+                                vocabulary
+    :param permutations:        NumPy 2d array, each row a permutation of the rows of reference_space.vectors, see
+                                random_permutations
+    :param chunk_size:          int, see permutation_batch_fsc
+    :return targets:            list, target words
+    :return fsc:                NumPy 2d array of shape (n_permutations, n_targets), the form-semantic consistency value
+                                of each target word when the vectors of the reference space are permuted, i.e. the
+                                values batch_levenshtein_fsc returns after reference_space.vectors has been replaced by
+                                reference_space.vectors[permutation]
+    """
+
+    targets, target_rows, neighbour_rows, lev_dis, segments, den = gather_fsc_indices(
+        targets2neighbors, embedding_space.word2id, reference_space.word2id
+    )
+    fsc = permutation_batch_fsc(
+        np.ascontiguousarray(embedding_space.vectors), np.ascontiguousarray(reference_space.vectors),
+        target_rows, neighbour_rows, lev_dis, segments, den, np.asarray(permutations), chunk_size=chunk_size
+    )
+
+    return targets, fsc
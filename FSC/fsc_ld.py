@@ -1,6 +1,4 @@
-import multiprocessing as mp
-from collections import defaultdict
-from sklearn.metrics.pairwise import cosine_similarity
+from fsc_batch import batch_levenshtein_fsc
 
 
 """
@@ -8,46 +6,17 @@ This module maps words, encoded orthographically or phonologically, to their for
 form-based neighbors are words with low Levenshtein distance to the target (as in Hendrix and Sun 2020.
 """
 
-def _mp_compute_ld_fsc(args):
 
-    return compute_ld_fsc(*args)
-
-
-def compute_ld_fsc(embeddings, reference_embeddings, target, neighbors):
-
-    num, den = 0, len(neighbors)
-    target_vector = embeddings.get_vector(target)
-
-    for n, lev_dis in neighbors:
-        try:
-            neighbour_vector = reference_embeddings.get_vector(n)
-            sim = abs(cosine_similarity(target_vector, neighbour_vector))
-            num += sim / lev_dis
-        except ValueError:
-            continue
-    fsc = float(num / den)
-
-    return target, fsc
-
-
-def levenshtein_fsc(targets2neighbors, embedding_space, reference_space, threads=8):
+def levenshtein_fsc(targets2neighbors, embedding_space, reference_space):
 
     """
     :param targets2neighbors:   dict, mapping target words to lists of neighbors
     :param embedding_space:     SemanticSpace object containing the semantic embeddings
-    :param threads:             int, the number of cores to spread the process over
+    :param reference_space:     SemanticSpace object containing the semantic embeddings of the reference vocabulary
     :return:                    dict, target words mapped to form-semantic consistency values computed using levenshtein
-                                distance to find nearest neighbors based on form, as in Hendrix and Sun 2020
+                                distance to find nearest neighbors based on form, as in Hendrix and Sun 2020. All targets are
+                                processed in a single vectorised pass (see fsc_batch). Targets without any neighbour get
+                                NaN
     """
 
-    t2fsc = defaultdict(int)
-
-    with mp.Pool(threads) as pool:
-        outputs = pool.imap(
-            _mp_compute_ld_fsc, ((embedding_space, reference_space, target, neighbors) for target, neighbors in targets2neighbors.items())
-        )
-        for output in outputs:
-            t, fsc = output
-            t2fsc[t] = fsc
-
-    return t2fsc
+    return batch_levenshtein_fsc(targets2neighbors, embedding_space, reference_space)
@@ -1,5 +1,7 @@
 import heapq
+import pickle
 import random
+import numpy as np
 import multiprocessing as mp
 from collections import defaultdict
 import time
@@ -43,11 +45,6 @@ def get_target_embedded_neighbors(targets, reference_words, celex=None):
     return target2neighbors
 
 
-def _mp_nearest_neighbors(args):
-
-    return nearest_neighbors(*args)
-
-
 def nearest_neighbors(n_neighbors, target, w2dist):
 
     nearest = []
@@ -70,6 +67,389 @@ def nearest_neighbors(n_neighbors, target, w2dist):
     
     return target, nearest
 
+
+class LevenshteinIndex(object):
+
+    """
+    An edit-distance index over the (orthographic or phonological) forms of a reference vocabulary. Forms are integer
+    coded and sorted by decreasing length, so that:
+    - the distances between a target and a whole range of reference forms are computed at once with the bit-parallel
+      algorithm of Myers (1999), as formulated by Hyyro (2001), vectorised over the reference forms: at each character
+      position only the prefix of forms which are still long enough is updated;
+    - since the Levenshtein distance is at least the difference in length between two forms, the search for the
+      nearest neighbours of a target only needs the band of forms whose length is within the current k-th distance
+      of the length of the target, which is a contiguous slice of the sorted forms. The band starts narrow and is only
+      widened when it does not yet contain enough neighbours.
+
+    Words can be added incrementally, so that one index can grow along with the reference vocabulary across age bins,
+    and queries can be restricted to subsets of the indexed words through boolean masks (see mask), so that the full,
+    child-produced and most-used reference vocabularies all share the same distance computations.
+    """
+
+    # the bit-parallel algorithm stores the columns of the dynamic programming matrix in 64-bit words, longer targets
+    # are compared using jellyfish instead
+    max_target_length = 64
+
+    # half-width, in characters, of the first band of reference forms searched for neighbours
+    initial_radius = 2
+
+    def __init__(self, reference_words=(), forms=None):
+
+        """
+        :param reference_words: iterable, reference words to index
+        :param forms:           dict, mapping reference words to the form used to compute distances (e.g. their
+                                phonological transcription). Default to None means words are indexed by their
+                                orthographic form
+        """
+
+        self.words = []
+        self.forms = []
+        self.word2position = {}
+        self._encoded = None
+
+        self.add(reference_words, forms)
+
+    def __len__(self):
+
+        return len(self.words)
+
+    def __getstate__(self):
+
+        # the encoded arrays are cheap to rebuild, there is no point in pickling them
+        state = self.__dict__.copy()
+        state['_encoded'] = None
+        return state
+
+    def add(self, reference_words, forms=None):
+
+        """
+        :param reference_words: iterable, reference words to add to the index. Words which are already indexed are
+                                skipped
+        :param forms:           dict, see __init__
+        """
+
+        for word in reference_words:
+            if word in self.word2position:
+                continue
+            self.word2position[word] = len(self.words)
+            self.words.append(word)
+            self.forms.append(forms[word] if forms else word)
+
+        self._encoded = None
+
+    def save(self, path):
+
+        """
+        :param path:    str, the path to the file where the index is pickled
+        """
+
+        pickle.dump(self, open(path, 'wb'))
+
+    @classmethod
+    def load(cls, path):
+
+        """
+        :param path:    str, the path to a file created using LevenshteinIndex.save
+        :return:        LevenshteinIndex object
+        """
+
+        return pickle.load(open(path, 'rb'))
+
+    def mask(self, words):
+
+        """
+        :param words:   iterable, words to restrict queries to; words which are not indexed are ignored
+        :return:        NumPy 1d array of booleans, True at the position of each of the words in the index
+        """
+
+        mask = np.zeros(len(self.words), dtype=bool)
+        mask[[self.word2position[w] for w in words if w in self.word2position]] = True
+
+        return mask
+
+    def _encode(self):
+
+        if self._encoded is None:
+            lengths = np.array([len(form) for form in self.forms], dtype=np.int64)
+            order = np.argsort(-lengths, kind='stable')
+            max_length = int(lengths.max()) if len(lengths) else 0
+
+            # code 0 is used for padding and never matches any character of a target
+            char2code = {}
+            codes = np.zeros((max_length, len(self.forms)), dtype=np.int64)
+            for row, position in enumerate(order):
+                for j, char in enumerate(self.forms[position]):
+                    codes[j, row] = char2code.setdefault(char, len(char2code) + 1)
+
+            # since forms are sorted by decreasing length, the forms with more than j characters are a prefix
+            sorted_lengths = lengths[order]
+            active = np.array([np.count_nonzero(sorted_lengths > j) for j in range(max_length)], dtype=np.int64)
+
+            self._encoded = order, codes, active, char2code, sorted_lengths
+
+        return self._encoded
+
+    def _band(self, length, radius):
+
+        # first and last (excluded) sorted rows holding forms whose length differs from length by at most radius
+        sorted_lengths = self._encode()[4]
+        lo = int(np.searchsorted(-sorted_lengths, -(length + radius), side='left'))
+        hi = int(np.searchsorted(-sorted_lengths, -(length - radius), side='right'))
+
+        return lo, hi
+
+    def _sorted_distances(self, form, lo, hi):
+
+        # distances between form and the reference forms in sorted rows lo to hi (excluded)
+        order, codes, active, char2code, sorted_lengths = self._encode()
+
+        if not form:
+            return sorted_lengths[lo:hi].copy()
+        if len(form) > self.max_target_length:
+            return np.array([levenshtein_distance(form, self.forms[p]) for p in order[lo:hi]], dtype=np.int64)
+
+        peq = np.zeros(len(char2code) + 1, dtype=np.uint64)
+        for i, char in enumerate(form):
+            code = char2code.get(char)
+            if code:
+                peq[code] |= np.uint64(1 << i)
+        top = np.uint64(1 << (len(form) - 1))
+        one = np.uint64(1)
+
+        score = np.full(hi - lo, len(form), dtype=np.int64)
+        pv = np.full(hi - lo, np.iinfo(np.uint64).max, dtype=np.uint64)
+        mv = np.zeros(hi - lo, dtype=np.uint64)
+        for j, n_active in enumerate(np.clip(active - lo, 0, hi - lo)):
+            if n_active == 0:
+                break
+            eq = peq[codes[j, lo:lo + n_active]]
+            pv_j = pv[:n_active]
+            mv_j = mv[:n_active]
+            xv = eq | mv_j
+            xh = (((eq & pv_j) + pv_j) ^ pv_j) | eq
+            ph = mv_j | ~(xh | pv_j)
+            mh = pv_j & xh
+            score[:n_active] += (ph & top) != 0
+            score[:n_active] -= (mh & top) != 0
+            ph = (ph << one) | one
+            mh = mh << one
+            pv[:n_active] = mh | ~(xv | ph)
+            mv[:n_active] = ph & xv
+
+        return score
+
+    def distances(self, form):
+
+        """
+        :param form:    str, the form of a target word
+        :return:        NumPy 1d array, Levenshtein distance between the target and each reference word, in the order
+                        in which the words were indexed
+        """
+
+        order = self._encode()[0]
+        dist = np.empty(len(self.words), dtype=np.int64)
+        dist[order] = self._sorted_distances(form, 0, len(self.words))
+
+        return dist
+
+    def _search(self, form, masks, k):
+
+        # returns the distances to the reference forms in the narrowest band which contains, for every mask, the k+1
+        # nearest masked words, together with the positions of the words in the band sorted by position
+        order = self._encode()[0]
+        n_words = len(self.words)
+        n_masked = [n_words if mask is None else int(np.count_nonzero(mask)) for mask in masks]
+
+        radius = self.initial_radius
+        while True:
+            lo, hi = self._band(len(form), radius)
+            dist = self._sorted_distances(form, lo, hi)
+            if hi - lo == n_words:
+                break
+            needed = radius
+            for mask, total in zip(masks, n_masked):
+                masked = dist if mask is None else dist[mask[order[lo:hi]]]
+                if len(masked) == total:
+                    continue
+                if len(masked) > k:
+                    # distance of the (k+1)-th nearest masked word in the band: if it is within the radius, no form
+                    # outside the band can be as close
+                    needed = max(needed, int(np.partition(masked, k)[k]))
+                else:
+                    needed = max(needed, 2 * radius + 1)
+            if needed == radius:
+                break
+            radius = needed
+
+        positions = order[lo:hi]
+        by_position = np.argsort(positions, kind='stable')
+
+        return dist[by_position], positions[by_position]
+
+    def nearest(self, form, k=20, mask=None):
+
+        """
+        :param form:    str, the form of a target word
+        :param k:       int, number of neighbours to consider
+        :param mask:    NumPy 1d array of booleans, see mask. Default to None means all indexed words are considered
+        :return:        list, (word, distance) tuples of the k nearest neighbours of the target including ties, in the
+                        order in which the words were indexed: these are exactly the neighbours nearest_neighbors finds
+                        scanning the whole (masked) reference vocabulary
+        """
+
+        return self.neighbourhoods(form, [mask], k=k)[0]
+
+    def neighbourhoods(self, form, masks, k=20):
+
+        """
+        :param form:    str, the form of a target word
+        :param masks:   list, NumPy 1d arrays of booleans (see mask) or None to consider all indexed words
+        :param k:       int, number of neighbours to consider
+        :return:        list, for each mask the nearest neighbours of the target (see nearest), all found from a single
+                        pass over the indexed forms
+        """
+
+        if len(self.words) == 0:
+            return [[] for _ in masks]
+
+        dist, positions = self._search(form, masks, k)
+
+        results = []
+        for mask in masks:
+            keep = np.ones(len(positions), dtype=bool) if mask is None else mask[positions]
+            masked_dist, masked_positions = dist[keep], positions[keep]
+            if len(masked_dist) == 0:
+                results.append([])
+                continue
+
+            kth = min(k, len(masked_dist) - 1)
+            threshold = np.partition(masked_dist, kth)[kth]
+            rows = np.flatnonzero((masked_dist > 0) & (masked_dist <= threshold))
+            results.append([(self.words[p], int(masked_dist[r])) for p, r in zip(masked_positions[rows], rows)])
+
+        return results
+
+
+# index (and subset masks) each worker of the pool receives once when it starts, see _init_index_worker
+levenshtein_index = None
+index_masks = None
+
+
+def _init_index_worker(index, masks=None):
+
+    global levenshtein_index
+    global index_masks
+    levenshtein_index = index
+    index_masks = masks
+
+
+def _mp_index_nearest(args):
+
+    targets, target_forms, k = args
+
+    return targets, [levenshtein_index.nearest(form, k) for form in target_forms]
+
+
+def query_levenshtein_index(index, targets, forms=None, k=20, threads=8, block_size=64):
+
+    """
+    :param index:       LevenshteinIndex object built over the reference vocabulary
+    :param targets:     iterable, target words
+    :param forms:       dict, mapping target words to the form to query the index with. Default to None means targets
+                        are queried using their orthographic form
+    :param k:           int, number of neighbours to consider
+    :param threads:     int, indicating how many cores to spread the blocks of targets over
+    :param block_size:  int, number of targets sent to a worker at once
+    :return:            dict, target words mapped to their k nearest neighbours (including ties) in the index
+    """
+
+    target2neighbors = defaultdict(list)
+
+    targets = list(targets)
+    blocks = [
+        (targets[start:start + block_size], [forms[t] if forms else t for t in targets[start:start + block_size]], k)
+        for start in range(0, len(targets), block_size)
+    ]
+
+    if threads > 1 and len(blocks) > 1:
+        with mp.Pool(threads, initializer=_init_index_worker, initargs=(index,)) as pool:
+            outputs = pool.imap(_mp_index_nearest, blocks)
+            for block_targets, block_neighbours in outputs:
+                target2neighbors.update(zip(block_targets, block_neighbours))
+    else:
+        for block_targets, block_forms, n_neighbors in blocks:
+            for target, form in zip(block_targets, block_forms):
+                target2neighbors[target] = index.nearest(form, n_neighbors)
+
+    return target2neighbors
+
+
+def _mp_index_neighbourhoods(args):
+
+    targets, target_forms, k = args
+
+    return targets, [levenshtein_index.neighbourhoods(form, index_masks, k=k) for form in target_forms]
+
+
+def levenshtein_neighbourhoods(index, targets, reference_subsets, forms=None, k=20, n_old=20, threads=8,
+                               block_size=64):
+
+    """
+    :param index:               LevenshteinIndex object, containing (at least) all the words in the reference subsets
+    :param targets:             iterable, target words
+    :param reference_subsets:   list, each element an iterable of reference words to restrict the neighbours to (e.g.
+                                the full, child-produced and most used reference vocabularies)
+    :param forms:               dict, mapping target words to the form to query the index with. Default to None means
+                                targets are queried using their orthographic form
+    :param k:                   int, number of neighbours to consider
+    :param n_old:               int, number of neighbours to average over for the OLD measure (20 for OLD20)
+    :param threads:             int, indicating how many cores to spread the blocks of targets over
+    :param block_size:          int, number of targets sent to a worker at once
+    :return:                    list, for each reference subset a tuple containing a dict mapping target words to their
+                                k nearest neighbours (as returned by get_levenshtein_neighbours) and a dict mapping
+                                target words to their OLD values. The distances between each target and the indexed
+                                forms are computed only once to find the neighbours in all subsets. The OLD values are
+                                computed separately for each subset by the old20 package (see compute_old20), on the
+                                forms of the targets and of the subset
+    """
+
+    from compute_old20 import calculate_old20
+
+    masks = [index.mask(subset) for subset in reference_subsets]
+    results = [(defaultdict(list), {}) for _ in masks]
+
+    targets = list(targets)
+    blocks = [
+        (targets[start:start + block_size], [forms[t] if forms else t for t in targets[start:start + block_size]],
+         k)
+        for start in range(0, len(targets), block_size)
+    ]
+
+    def collect(block_targets, block_neighbourhoods):
+        for target, neighbourhoods in zip(block_targets, block_neighbourhoods):
+            for (target2neighbors, _), nearest in zip(results, neighbourhoods):
+                target2neighbors[target] = nearest
+
+    if threads > 1 and len(blocks) > 1:
+        with mp.Pool(threads, initializer=_init_index_worker, initargs=(index, masks)) as pool:
+            for block_targets, block_neighbourhoods in pool.imap(_mp_index_neighbourhoods, blocks):
+                collect(block_targets, block_neighbourhoods)
+    else:
+        for block_targets, block_forms, n_neighbors in blocks:
+            collect(block_targets, [index.neighbourhoods(form, masks, k=n_neighbors) for form in block_forms])
+
+    # targets sharing a form share its OLD value
+    target_forms = [forms[t] if forms else t for t in targets]
+    unique_forms = list(dict.fromkeys(target_forms))
+    for subset, (_, target2old) in zip(reference_subsets, results):
+        subset_forms = [index.forms[index.word2position[w]] for w in subset if w in index.word2position]
+        form2old = calculate_old20(unique_forms, subset_forms, n=n_old)
+        for target, form in zip(targets, target_forms):
+            target2old[target] = form2old[form]
+
+    return results
+
+
 def get_levenshtein_neighbours(targets, reference_words, celex=None, k=20, threads=8):
 
     """
@@ -85,29 +465,15 @@ def get_levenshtein_neighbours(targets, reference_words, celex=None, k=20, threa
 
     begintime = time.time()
 
-    target2levenshtein = defaultdict(dict)
-    target2neighbors = defaultdict(list)
-
     if celex:
-        # create phonological representation of reference words
+        # create phonological representation of reference words and index them by their phonological transcriptions
         ref_phon = {k: v for k, v in get_celex_coverage(reference_words, celex)[0]}
-        # then find neighbors according to phonological transcriptions
-        for target_ortho, target_phon in targets.items():
-            for reference_ortho, reference_phon in ref_phon.items():
-                target2levenshtein[target_ortho][reference_ortho] = levenshtein_distance(target_phon, reference_phon)
+        index = LevenshteinIndex(ref_phon, forms=ref_phon)
     else:
-        # find neighbours for all words in reference_words based on orthographic encoding
-        for target_ortho in targets:
-            for reference_ortho in reference_words:
-                target2levenshtein[target_ortho][reference_ortho] = levenshtein_distance(target_ortho, reference_ortho)
-
-    with mp.Pool(threads) as pool:
-        outputs = pool.imap(
-            _mp_nearest_neighbors, ((k, target, w2dist) for target, w2dist in target2levenshtein.items())
-        )
-        for output in outputs:
-            t, nearest = output
-            target2neighbors[t] = nearest
+        # index all words in reference_words based on orthographic encoding
+        index = LevenshteinIndex(reference_words)
+
+    target2neighbors = query_levenshtein_index(index, targets, forms=targets if celex else None, k=k, threads=threads)
 
     endtime = time.time()
     print("elapsed: ", endtime - begintime)
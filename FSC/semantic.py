@@ -1,63 +1,159 @@
-import heapq
 import time
 import numpy as np
 import multiprocessing as mp
 from datetime import datetime
 from collections import defaultdict
-import pandas as pd
-from scipy import spatial
+from shared_space import SharedArray, as_shared_space
 
 
+# shared arrays and subset positions each worker of the pool attaches to when it starts, see _init_snd_worker
+target_vectors = None
+unit_reference_vectors = None
+subset_positions = None
+
+
+def _init_snd_worker(target_handle, unit_reference_handle, positions):
+
+    global target_vectors
+    global unit_reference_vectors
+    global subset_positions
+
+    target_vectors = SharedArray.attach(target_handle)
+    unit_reference_vectors = SharedArray.attach(unit_reference_handle)
+    subset_positions = positions
+
 
 def _mp_compute_snd(args):
 
-    return compute_snd(*args)
+    n_neighbors, rows = args
 
+    return compute_snd(target_vectors.array[rows], unit_reference_vectors.array, subset_positions, n_neighbors)
 
-def compute_snd(embeddings, reference_wordvecs, n_neighbors, w):
 
-    wordvec_w = embeddings.word_vector(w)
+def _unit_rows(matrix):
 
-    nlargest = heapq.nlargest(
-        n_neighbors,
-        [1 - spatial.distance.cosine(wordvec_w, wv) for wv in reference_wordvecs])
+    # rows with zero norm are left as zeros, so that their cosine similarity to any vector is 0
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
 
-    snd = np.mean(nlargest)
+    return matrix / norms
 
-    return w, snd
 
+def compute_snd(target_block, unit_reference, positions, n_neighbors):
 
-def neighborhood_density(embeddings, reference_space, target_words, reference_words, n_neighbors=20, threads=8):
+    """
+    :param target_block:        NumPy 2d array, vectors of a block of target words
+    :param unit_reference:      NumPy 2d array, the vectors of the reference words in the union of all subsets,
+                                normalised to unit length (once for all blocks, see semantic_neighborhood_densities)
+    :param positions:           list, for each reference subset a NumPy 1d array with the rows of unit_reference which
+                                belong to it
+    :param n_neighbors:         int, number of neighbours to consider
+    :return:                    NumPy 2d array of shape (n_subsets, n_targets), the mean cosine similarity between each
+                                target and its n_neighbors most similar words in each subset (NaN for empty subsets).
+                                Vectors with zero norm have similarity 0 to every word
+    """
+
+    # one similarity pass over the union of all subsets, whose columns are then selected for each subset
+    sims = np.dot(_unit_rows(target_block), unit_reference.T)
+
+    snd = np.full((len(positions), len(target_block)), np.nan)
+    for i, subset in enumerate(positions):
+        if len(subset) == 0:
+            continue
+        subset_sims = sims if len(subset) == len(unit_reference) else sims[:, subset]
+        k = min(n_neighbors, len(subset))
+        nlargest = np.partition(subset_sims, len(subset) - k, axis=1)[:, len(subset) - k:]
+        snd[i] = nlargest.mean(axis=1, dtype=np.float64)
+
+    return snd
+
+
+def semantic_neighborhood_densities(embeddings, reference_space, target_words, reference_subsets, n_neighbors=20,
+                                    threads=8, block_size=512):
 
     """
-    :param embeddings:      a SemanticSpace object of the target vocab
-    :param reference_space: a SemeanticSpace object of the reference vocab
-    :param target_words:    list, target words for which to compute snd.
-    :param reference_words: list, reference vocabulary listing words to consider as valid neighbors.
-    :param n:               int, number of neighbours to consider. Default to 20.
-    :param threads:         int, the number of cores to use for parallel processing.
-    :return:                dict, mapping words to their respective SND values. Higher values indicate sparser semantic
-                            neighborhoods
+    :param embeddings:          a SemanticSpace object of the target vocab, or a SharedSpace object created from it
+                                (see shared_space) to reuse the same shared memory store across calls
+    :param reference_space:     a SemanticSpace object of the reference vocab, or a SharedSpace object created from it
+    :param target_words:        list, target words for which to compute snd.
+    :param reference_subsets:   list, each element a list of reference words to consider as valid neighbors (e.g. the
+                                full, child-produced and most used reference vocabularies)
+    :param n_neighbors:         int, number of neighbours to consider. Default to 20.
+    :param threads:             int, the number of cores to spread the blocks of targets over.
+    :param block_size:          int, number of targets whose similarities to the reference words are computed at once,
+                                which bounds the memory needed to block_size times the number of reference words
+    :return:                    list, for each reference subset a dict mapping words to their respective SND values.
+                                Higher values indicate denser semantic neighborhoods
     """
 
-    w2snd = defaultdict(float)
+    if not reference_subsets:
+        return []
+
+    w2snds = [defaultdict(float) for _ in reference_subsets]
 
     print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started computing semantic neighborhood density..."))
 
     begintime = time.time()
 
-    reference_wordvecs = []
-    for word in reference_words:
-        reference_wordvecs.append(reference_space.word_vector(word))
-
-    with mp.Pool(threads) as pool:
-        outputs = pool.imap(_mp_compute_snd, ((embeddings, reference_wordvecs, n_neighbors, word) for word in target_words))
-        for w, snd in outputs:
-            w2snd[w] = snd
+    target_store, own_target_store = as_shared_space(embeddings)
+    reference_store, own_reference_store = as_shared_space(reference_space)
+    columns = [np.sort(reference_store.rows(reference_words)) for reference_words in reference_subsets]
+    # the reference rows of all subsets are gathered and normalised once, rather than for every block of targets, and
+    # each subset is then a set of positions in the normalised matrix
+    union = np.unique(np.concatenate(columns)) if len(columns) > 1 else columns[0]
+    unit_reference = SharedArray.create(_unit_rows(reference_store.vectors.array[union]))
+    positions = [np.searchsorted(union, subset) for subset in columns]
+    target_words = list(target_words)
+    target_rows = target_store.rows(target_words)
+    blocks = [target_rows[start:start + block_size] for start in range(0, len(target_rows), block_size)]
+
+    def collect(start, snd):
+        for i, w2snd in enumerate(w2snds):
+            for w, value in zip(target_words[start:start + block_size], snd[i]):
+                w2snd[w] = float(value)
+
+    try:
+        if threads > 1 and len(blocks) > 1:
+            # workers attach to the vectors by name and only receive the rows of a block of targets, so neither
+            # starting them nor sending them a task requires pickling the vectors
+            with mp.Pool(threads, initializer=_init_snd_worker,
+                         initargs=(target_store.handle(), unit_reference.handle(), positions)) as pool:
+                for b, snd in enumerate(pool.imap(_mp_compute_snd, ((n_neighbors, rows) for rows in blocks))):
+                    collect(b * block_size, snd)
+        else:
+            for b, rows in enumerate(blocks):
+                collect(b * block_size, compute_snd(
+                    target_store.vectors.array[rows], unit_reference.array, positions, n_neighbors
+                ))
+    finally:
+        unit_reference.close()
+        if own_target_store:
+            target_store.close()
+        if own_reference_store:
+            reference_store.close()
 
     endtime = time.time()
 
     print("elapsed: ", endtime - begintime)
     print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done."))
 
-    return w2snd
+    return w2snds
+
+
+def neighborhood_density(embeddings, reference_space, target_words, reference_words, n_neighbors=20, threads=8):
+
+    """
+    :param embeddings:      a SemanticSpace object of the target vocab, or a SharedSpace object created from it (see
+                            shared_space) to reuse the same shared memory store across calls
+    :param reference_space: a SemeanticSpace object of the reference vocab, or a SharedSpace object created from it
+    :param target_words:    list, target words for which to compute snd.
+    :param reference_words: list, reference vocabulary listing words to consider as valid neighbors.
+    :param n:               int, number of neighbours to consider. Default to 20.
+    :param threads:         int, the number of cores to use for parallel processing.
+    :return:                dict, mapping words to their respective SND values. Higher values indicate denser semantic
+                            neighborhoods
+    """
+
+    return semantic_neighborhood_densities(
+        embeddings, reference_space, target_words, [reference_words], n_neighbors=n_neighbors, threads=threads
+    )[0]
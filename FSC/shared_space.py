@@ -0,0 +1,151 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+
+"""
+This module stores arrays, and the vectors of semantic spaces, in blocks of shared memory. The workers of a
+multiprocessing pool attach to them by name, so neither starting a worker nor sending it a task requires pickling
+anything whose size depends on the vocabulary, and the same code works whether workers are forked or spawned.
+"""
+
+
+class SharedArray(object):
+
+    """
+    A NumPy array backed by a named block of shared memory. The process creating the array owns the block and is
+    responsible for unlinking it, processes attaching to it by name only close their view when done.
+    """
+
+    def __init__(self, shm, shape, dtype, owner):
+
+        self.shm = shm
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = owner
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, array, dtype=None):
+
+        """
+        :param array:   array-like, the values to copy into shared memory
+        :param dtype:   str or NumPy dtype, the type of the shared array. Default to None keeps the type of array
+        :return:        SharedArray object owning a new block of shared memory
+        """
+
+        array = np.asarray(array, dtype=dtype)
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = cls(shm, array.shape, array.dtype, owner=True)
+        shared.array[...] = array
+
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+
+        """
+        :param handle:  tuple, as returned by SharedArray.handle
+        :return:        SharedArray object viewing an existing block of shared memory
+        """
+
+        name, shape, dtype = handle
+
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype, owner=False)
+
+    def handle(self):
+
+        """
+        :return:        tuple, the (name, shape, dtype) triple workers need to attach to the array: its size does not
+                        depend on the size of the array
+        """
+
+        return self.shm.name, self.shape, self.dtype.str
+
+    def close(self):
+
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc):
+
+        self.close()
+
+
+class SharedSpace(object):
+
+    """
+    The vectors of a semantic space stored as a float32 SharedArray, together with a word to row index which only lives
+    in the process that created the store: workers receive row indices, never words.
+    """
+
+    def __init__(self, words, vectors):
+
+        self.words = list(words)
+        self.word2row = {w: i for i, w in enumerate(self.words)}
+        self.vectors = vectors
+
+    @classmethod
+    def from_space(cls, space, dtype='float32'):
+
+        """
+        :param space:   SemanticSpace object (or any object exposing words and vectors)
+        :param dtype:   str, the type of the shared vectors. Default to float32 halves the memory footprint; use float64
+                        to reproduce the numbers computed on the SemanticSpace itself
+        :return:        SharedSpace object
+        """
+
+        return cls(space.words, SharedArray.create(space.vectors, dtype=dtype))
+
+    def rows(self, words):
+
+        """
+        :param words:   iterable, words in the space
+        :return:        NumPy 1d array, the row index of each word
+        """
+
+        return np.array([self.word2row[w] for w in words], dtype=np.int64)
+
+    def included_words(self):
+
+        return set(self.word2row)
+
+    def get_vector(self, word):
+
+        return self.vectors.array[self.word2row[word]].reshape(1, -1)
+
+    def handle(self):
+
+        return self.vectors.handle()
+
+    def close(self):
+
+        self.vectors.close()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc):
+
+        self.close()
+
+
+def as_shared_space(space, dtype='float32'):
+
+    """
+    :param space:   SemanticSpace or SharedSpace object
+    :param dtype:   str, the type of the shared vectors if a new store has to be created
+    :return space:  SharedSpace object
+    :return owned:  bool, True if a new store was created, which the caller then needs to close
+    """
+
+    if isinstance(space, SharedSpace):
+        return space, False
+
+    return SharedSpace.from_space(space, dtype=dtype), True
@@ -0,0 +1,179 @@
+import os
+import json
+import pickle
+import hashlib
+import numpy as np
+from datetime import datetime
+
+
+"""
+This module caches the results of the expensive stages of the pipeline (semantic neighbourhood densities, Levenshtein
+neighbours and old20 values, form-semantic consistency values) on disk, under a key computed from the content of their
+inputs: the semantic spaces, the vocabularies and the parameters. A stage is therefore only recomputed when one of its
+inputs changed, whatever the name of the files the inputs come from, and results computed on different inputs never
+overwrite each other. The least recently used results are deleted when the cache grows beyond its maximum size.
+"""
+
+
+class StageCache(object):
+
+    """
+    A folder of pickled stage results, each stored in a file named after the key of the stage and its inputs.
+    """
+
+    def __init__(self, folder, max_bytes=5 * 1024 ** 3, force_recomputation=False):
+
+        """
+        :param folder:              str, the path to the folder where results are stored
+        :param max_bytes:           int, the maximum size of the cache: when it is exceeded, the results which were
+                                    used least recently are deleted
+        :param force_recomputation: bool, if True stored results are never read, but results are still stored
+        """
+
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.force_recomputation = force_recomputation
+        # fingerprints of the large objects (spaces, matrices) hashed so far, which are hashed only once per run
+        self.fingerprints = dict()
+        os.makedirs(folder, exist_ok=True)
+
+    def fingerprint(self, value):
+
+        """
+        :param value:   the input of a stage: a semantic space (any object exposing words and vectors), a NumPy array,
+                        a set, list, tuple or dict of inputs, or a scalar
+        :return:        str, a digest of the content of the value. Sets (e.g. vocabularies) are hashed independently of
+                        the order of their elements, lists and tuples in order, dicts by sorted key
+        """
+
+        if hasattr(value, 'words') and hasattr(value, 'vectors') or isinstance(value, np.ndarray):
+            if id(value) not in self.fingerprints:
+                self.fingerprints[id(value)] = (value, self._hash_large(value))
+            return self.fingerprints[id(value)][1]
+
+        digest = hashlib.sha1()
+        if isinstance(value, (set, frozenset)):
+            digest.update(b'set')
+            for element in sorted(self.fingerprint(v) for v in value):
+                digest.update(element.encode())
+        elif isinstance(value, (list, tuple)):
+            digest.update(b'list')
+            for v in value:
+                digest.update(self.fingerprint(v).encode())
+        elif isinstance(value, dict):
+            digest.update(b'dict')
+            for k in sorted(value, key=repr):
+                digest.update(self.fingerprint(k).encode())
+                digest.update(self.fingerprint(value[k]).encode())
+        else:
+            digest.update(repr((type(value).__name__, value)).encode())
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def _hash_large(value, chunk_rows=10000):
+
+        digest = hashlib.sha1()
+        if isinstance(value, np.ndarray):
+            matrix = value
+        else:
+            digest.update(json.dumps(list(value.words)).encode())
+            matrix = np.asarray(value.vectors)
+        digest.update(str((matrix.shape, matrix.dtype.str)).encode())
+        # memory-mapped matrices are hashed in chunks of rows, so that they are never read into memory as a whole
+        for start in range(0, len(matrix), chunk_rows):
+            digest.update(np.ascontiguousarray(matrix[start:start + chunk_rows]).view(np.uint8))
+
+        return digest.hexdigest()
+
+    def key(self, stage, **inputs):
+
+        """
+        :param stage:   str, the name of the stage
+        :param inputs:  the inputs of the stage, by name. The key of another stage can be passed as an input to stand
+                        for its result, e.g. the neighbours the consistency values are computed from
+        :return:        str, the key of the result of the stage on these inputs
+        """
+
+        digest = hashlib.sha1(stage.encode())
+        for name in sorted(inputs):
+            digest.update(name.encode())
+            digest.update(self.fingerprint(inputs[name]).encode())
+
+        return stage + '_' + digest.hexdigest()
+
+    def path(self, key):
+
+        return os.path.join(self.folder, key + '.pkl')
+
+    def load(self, key):
+
+        """
+        :param key:     str, as returned by StageCache.key
+        :return:        the stored result, or None if there is none (or force_recomputation is set)
+        """
+
+        path = self.path(key)
+        if self.force_recomputation or not os.path.exists(path):
+            return None
+
+        result = pickle.load(open(path, 'rb'))
+        # mark the result as recently used
+        os.utime(path)
+        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Result {} found and loaded.".format(key)))
+
+        return result
+
+    def store(self, key, result):
+
+        """
+        :param key:     str, as returned by StageCache.key
+        :param result:  any picklable object, the result of the stage
+        """
+
+        path = self.path(key)
+        # write to a temporary file first, so that an interrupted write never leaves a truncated result behind
+        pickle.dump(result, open(path + '.tmp', 'wb'), protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+
+        """
+        :param keep:    str, the path of a result which must not be deleted (the one just stored)
+
+        Deletes the results which were used least recently until the cache fits in max_bytes.
+        """
+
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith('.pkl'):
+                stat = os.stat(os.path.join(self.folder, name))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(self.folder, name)))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+
+    def cached(self, stage, compute, **inputs):
+
+        """
+        :param stage:   str, the name of the stage
+        :param compute: function without arguments, computing the result of the stage
+        :param inputs:  the inputs of the stage, by name, see StageCache.key
+        :return result: the result of the stage, read from the cache or computed and stored
+        :return key:    str, the key of the result
+        """
+
+        key = self.key(stage, **inputs)
+        result = self.load(key)
+        if result is None:
+            result = compute()
+            self.store(key, result)
+
+        return result, key
@@ -5,250 +5,235 @@ import random
 import copy
 import numpy as np
 import pickle
-import string
-from semspaces.space import SemanticSpace
+from binary_space import load_space
 from datetime import datetime
 from neighbors import get_levenshtein_neighbours
 from fsc_ld_linux import levenshtein_fsc
 from fsc_ld_full_linux import levenshtein_fsc_full
+from functools import partial
+from scheduler import run_age_bins
 
-if __name__ == '__main__':
-       
-    #ask for the path to the map in which all file will be stored
-    fsc_dir_strongvsweak = input("Please provide a path to a map where all output will be stored\n")
-    if not os.path.exists(fsc_dir_rnd):
-        raise ValueError("This directory does not exist, please provide a valid path!")
+#number of age bins computed at the same time (each in its own process), and the memory in bytes the bins computed at
+#the same time may need together, estimated from the size of their input files (None for no limit), see scheduler
+processes = 4
+memory_budget = 32 * 1024 ** 3
 
-    #ask for all files needed for the computations
-    reference_w2v_space_filebase = input("Please provide the path to the directory where all reference w2v spaces are stored\n") 
-    if not os.path.exists(reference_w2v_space_filebase):
-        raise ValueError("This directory does not exist, please provide a valid path!")
+def write_df(targets, out_path, OSC_ld):
 
-    target_w2v_space_filebase = input("Please provide the path to the directory where all target w2v spaces are stored\n") 
-    if not os.path.exists(target_w2v_space_filebase):
-        raise ValueError("This directory does not exist, please provide a valid path!")
+    values = []
+    for word in targets:
+        values.append(
+            [word, OSC_ld[word]]
+        )
 
-    produced_reference_w2v_filebase = input("Please provide the path to the directory where all produced reference w2v spaces are stored\n") 
-    if not os.path.exists(produced_reference_w2v_filebase):
-        raise ValueError("This directory does not exist, please provide a valid path!")
+    final_df = pd.DataFrame(
+        data = values,
+        columns = ["word", "OSC_ld"]
+    )
 
-    reference_wordcounts_filebase = input("Please provide the path to the directory where all reference wordcounts are stored\n") 
-    if not os.path.exists(reference_wordcounts_filebase):
-        raise ValueError("This directory does not exist, please provide a valid path!")
+    final_df.to_csv(out_path, index = False, sep = ';')
 
-    target_wordcounts_filebase = input("Please provide the path to the directory where all target wordcounts are stored\n") 
-    if not os.path.exists(target_wordcounts_filebase):
-        raise ValueError("This directory does not exist, please provide a valid path!")
+def compute_age_bin(bin_files, fsc_dir_strongvsweak):
 
-    reference_w2v_filelist = sorted(os.listdir(reference_w2v_space_filebase))
-    target_w2v_filelist = sorted(os.listdir(target_w2v_space_filebase))
-    produced_reference_w2v_filelist = sorted(os.listdir(produced_reference_w2v_filebase))
-    reference_wordcounts_filelist = sorted(os.listdir(reference_wordcounts_filebase))
-    target_wordcounts_filelist = sorted(os.listdir(target_wordcounts_filebase))
+    """
+    :param bin_files:            dict, mapping the names of the input files of an age bin to their paths
+    :param fsc_dir_strongvsweak: str, the path to the folder where the measures of the age bin are written
+    """
 
-    def write_df(targets, out_path, OSC_ld):
+    reference_space_file = bin_files["reference_w2v"]
+    reference_space = load_space(
+        reference_space_file, prenorm = True
+    )
+    w2v_reference = reference_space.included_words()
 
-        values = []
-        for word in targets:
-            values.append(
-                [word, OSC_ld[word]]
-            )
+    reference_wordcount = json.load(
+        open(bin_files["reference_wordcounts"])
+    )
+    age_bin_reference = reference_wordcount["Age_in_Months"]
 
-        final_df = pd.DataFrame(
-            data = values,
-            columns = ["word", "OSC_ld"]
-        )
-
-        final_df.to_csv(out_path, index = False, sep = ';')
+    vocab = set(w2v_reference)
 
-    for i in range(len(reference_w2v_filelist)):
+    print('The vocabulary for retrieving form-based neighbors consists of {} words.'.format(len(vocab)))
 
+    #check if the file containing all fsc values already exists and open it, if not, compute fsc values and save this to file
+    filename_full = "full_fsc_measures_strongvsweak_" + str(age_bin_reference) + ".csv"
+    out_path = os.path.join(fsc_dir_strongvsweak, filename_full)
+    #words are read as they are: with the default NA handling words like "nan", "null" or "NA" would become NaN
+    try:
+        systematicity_file = pd.read_csv(out_path, sep = ";", converters = {"word": str})
+        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File {} found and loaded.".format(out_path)))
+    except FileNotFoundError:   
+        #find neighbors (levenshstein) for orthographic froms
         print(
-            datetime.now().strftime(
-                "%d/%m/%Y %H:%M:%S: Started computation for batch {} out of {}. \n".format(
-                    i+1, len(reference_w2v_filelist
-                             )
-                )
-            )
+            datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started retrieving Levenshtein distance neighbors for orthographic forms for full reference.")
         )
-
-        reference_space_file = os.path.join(reference_w2v_space_filebase, reference_w2v_filelist[i])
-        reference_space = SemanticSpace.from_csv(
-            reference_space_file, prenorm = True
+        ortho2neighbors_ld = get_levenshtein_neighbours(vocab, vocab)
+        print(
+            datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done retrieving Levenshtein distance neighbors for orthographic forms for full reference.")
         )
-        w2v_reference = reference_space.included_words()
 
-        reference_wordcount = json.load(
-            open(os.path.join(reference_wordcounts_filebase, reference_wordcounts_filelist[i]))
+        #find levenshtein distances for all words in the reference vocab, so that they all have a measure of systematicity
+        full_ldfile = "full_OSC_ld" + str(age_bin_reference) + ".pkl"
+        osc_ld_path = os.path.join(fsc_dir_strongvsweak, full_ldfile)
+        try:
+            t2OSC_ld = pickle.load(open(osc_ld_path, "rb"))
+            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File {} found and loaded.".format(osc_ld_path)))
+        except FileNotFoundError:
+            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started computing Levenshtein OSC..."))
+            t2OSC_ld = levenshtein_fsc_full(ortho2neighbors_ld, reference_space)
+            pickle.dump(t2OSC_ld, open(osc_ld_path, "wb"))
+            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done."))
+            print()
+
+        write_df(vocab, out_path, t2OSC_ld)
+        systematicity_file = pd.read_csv(out_path, sep = ";", converters = {"word": str})
+        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File {} created.".format(out_path)))
+
+    embedding_space = load_space(
+        bin_files["target_w2v"], prenorm = True
+    )
+    w2v_words = embedding_space.included_words()
+
+    wordcount = json.load(open(bin_files["target_wordcounts"]))
+    age_bin = wordcount["Age_in_Months"]
+
+    child_produced_space = load_space(
+        bin_files["produced_reference_w2v"], prenorm = True
         )
-        age_bin_reference = reference_wordcount["Age_in_Months"]
+    w2v_child_produced = child_produced_space.included_words()
 
-        vocab = set(w2v_reference)
+    systematicity_scores = systematicity_file.sort_values(by=['OSC_ld'], ascending = False)
 
-        print('The vocabulary for retrieving form-based neighbors consists of {} words.'.format(len(vocab)))
+    percentage_list = [0.1, 0.3, 0.5, 0.7, 0.9]
 
-        #check if the file containing all fsc values already exists and open it, if not, compute fsc values and save this to file
-        filename_full = "full_fsc_measures_strongvsweak_" + str(age_bin_reference) + ".csv"
-        out_path = os.path.join(fsc_dir_strongvsweak, filename_full)
+    #obtain target vocabulary: words which are in the current vocab, but not in the reference one
+    # (and occur at least twice)
+    precursor_target_vocab = set(w2v_reference.symmetric_difference(w2v_words))
+    target_vocab_list = []
+    for word in precursor_target_vocab:
         try:
-            systematicity_file = pd.read_csv(out_path, sep = ";")
-            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File {} found and loaded.".format(out_path)))
-        except FileNotFoundError:   
-            #find neighbors (levenshstein) for orthographic froms
-            print(
-                datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started retrieving Levenshtein distance neighbors for orthographic forms for full reference.")
-            )
-            ortho2neighbors_ld = get_levenshtein_neighbours(vocab, vocab)
-            print(
-                datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done retrieving Levenshtein distance neighbors for orthographic forms for full reference.")
-            )
+            if wordcount[word] >= 2:
+                target_vocab_list.append(word)
+        except KeyError:
+            continue
+    target_vocab = set(target_vocab_list)
 
-            #find levenshtein distances for all words in the reference vocab, so that they all have a measure of systematicity
-            full_ldfile = "full_OSC_ld" + str(age_bin_reference) + ".pkl"
-            osc_ld_path = os.path.join(fsc_dir_strongvsweak, full_ldfile)
-            try:
-                t2OSC_ld = pickle.load(open(osc_ld_path, "rb"))
-                print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File {} found and loaded.".format(osc_ld_path)))
-            except FileNotFoundError:
-                print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started computing Levenshtein OSC..."))
-                t2OSC_ld = levenshtein_fsc_full(ortho2neighbors_ld, reference_space)
-                pickle.dump(t2OSC_ld, open(osc_ld_path, "wb"))
-                print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done."))
-                print()
-
-            write_df(vocab, out_path, t2OSC_ld)
-            systematicity_file = pd.read_csv(out_path, sep = ";")
-            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: File {} created.".format(out_path)))
-
-        embedding_space = SemanticSpace.from_csv(
-            os.path.join(target_w2v_space_filebase, target_w2v_filelist[i]), prenorm = True
+    #obtain all words from the reference vocab, which have been uttered by the child before
+    produced_reference_vocab = list(w2v_reference.intersection(w2v_child_produced))
+
+    print('The target vocabulary for retrieving form-based neighbors consists of {} words.'.format(
+        len(target_vocab))
+    )
+
+    print('The child-produced reference vocabulary for retrieving form-based neighbors consists of {} words.'.format(
+        len(produced_reference_vocab))
+    )
+
+    #find neighbors (levenshstein) for orthographic froms
+    print(
+        datetime.now().strftime(
+            "%d/%m/%Y %H:%M:%S: Started retrieving Levenshtein distance neighbors for orthographic forms."
         )
-        w2v_words = embedding_space.included_words()
+    )
+    produced_ortho2neighbors_ld = get_levenshtein_neighbours(target_vocab, produced_reference_vocab)
+    print(
+        datetime.now().strftime(
+            "%d/%m/%Y %H:%M:%S: Done retrieving Levenshtein distance neighbors for orthographic forms."
+        )
+    )
 
-        wordcount = json.load(open(os.path.join(target_wordcounts_filebase, target_wordcounts_filelist[i])))
-        age_bin = wordcount["Age_in_Months"]
+    for n in range(len(percentage_list)):
+        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started computing for percentage batch {} of {}...".format(n + 1, len(percentage_list))))
+        most_systematic = systematicity_scores.head(round(len(systematicity_scores)*percentage_list[n]))
+        most_systematic_list = most_systematic["word"].tolist()
 
-        child_produced_space = SemanticSpace.from_csv(
-            os.path.join(produced_reference_w2v_filebase, produced_reference_w2v_filelist[i]), prenorm = True
-            )
-        w2v_child_produced = child_produced_space.included_words()
+        filename = "fsc_measures_strongvsweak" + str(percentage_list[n]) + "_" + str(age_bin) + ".csv"
 
-        systematicity_scores = systematicity_file.sort_values(by=['OSC_ld'], ascending = False)
+        targets = list(target_vocab)
+        final_df = pd.DataFrame(
+            data = targets, 
+            columns = ["word"]
+        )
 
-        percentage_list = [0.1, 0.3, 0.5, 0.7, 0.9]
+        #shuffle the semantic vectors of the most systematic words among themselves and do this n times: each
+        #shuffle is an in-memory view of the reference space, the seed of each shuffle is written to file
+        n_subsamples = 100
+        seeds = random.sample(range(0, 100000000), n_subsamples)
+        seeds_filename = "fsc_measures_strongvsweak_seeds" + str(percentage_list[n]) + "_" + str(age_bin) + ".json"
+        json.dump(seeds, open(os.path.join(fsc_dir_strongvsweak, seeds_filename), 'w'))
+        for j, seed in enumerate(seeds):
+            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started random shuffle {} of {}...".format(j + 1, n_subsamples)))
+            new_reference_space = reference_space.shuffled(most_systematic_list, seed)
 
-        #obtain target vocabulary: words which are in the current vocab, but not in the reference one
-        # (and occur at least twice)
-        precursor_target_vocab = set(w2v_reference.symmetric_difference(w2v_words))
-        target_vocab_list = []
-        for word in precursor_target_vocab:
-            try:
-                if wordcount[word] >= 2:
-                    target_vocab_list.append(word)
-            except KeyError:
-                continue
-        target_vocab = set(target_vocab_list)
+            #compute fsc values with the shuffle embedding space
+            produced_t2OSC_ld_shuffled = levenshtein_fsc(produced_ortho2neighbors_ld, embedding_space, new_reference_space)
 
-        #obtain all words from the reference vocab, which have been uttered by the child before
-        produced_reference_vocab = list(w2v_reference.intersection(w2v_child_produced))
+            values = []
 
-        print('The target vocabulary for retrieving form-based neighbors consists of {} words.'.format(
-            len(target_vocab))
-        )
+            for word in targets:
+                values.append(
+                    [word, produced_t2OSC_ld_shuffled[word]]
+                )
 
-        print('The child-produced reference vocabulary for retrieving form-based neighbors consists of {} words.'.format(
-            len(produced_reference_vocab))
-        )
+            produced = "produced_OSC_shuffled" + str(j+1)
 
-        #find neighbors (levenshstein) for orthographic froms
-        print(
-            datetime.now().strftime(
-                "%d/%m/%Y %H:%M:%S: Started retrieving Levenshtein distance neighbors for orthographic forms."
-            )
-        )
-        produced_ortho2neighbors_ld = get_levenshtein_neighbours(target_vocab, produced_reference_vocab)
-        print(
-            datetime.now().strftime(
-                "%d/%m/%Y %H:%M:%S: Done retrieving Levenshtein distance neighbors for orthographic forms."
+            df = pd.DataFrame(
+                data = values,
+                columns = ["word", produced]
             )
-        )
 
-        for n in range(len(percentage_list)):
-            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started computing for percentage batch {} of {}...".format(n + 1, len(percentage_list))))
-            most_systematic = systematicity_scores.head(round(len(systematicity_scores)*percentage_list[n]))
-            most_systematic_list = most_systematic["word"].tolist()
+            final_df = pd.merge(final_df, df, on = "word")
 
-            filename = "fsc_measures_strongvsweak" + str(percentage_list[n]) + "_" + str(age_bin) + ".csv"
+        final_df.to_csv(os.path.join(fsc_dir_strongvsweak, filename), index = False, sep = ';')
 
-            targets = list(target_vocab)
-            final_df = pd.DataFrame(
-                data = targets, 
-                columns = ["word"]
-            )
+    print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done with computing for percentage batch {} of {}...".format(n + 1, len(percentage_list))))
 
-            #shuffle list to replace the most systematic words with others and do this n times
-            n_subsamples = 100
-            for j in range(n_subsamples):
-                print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Started random shuffle {} of {}...".format(j + 1, n_subsamples)))
-                shuffled_list = random.sample(most_systematic_list, len(most_systematic_list))
-
-                def get_random_string(length):
-                    # choose from all lowercase letter
-                    letters = string.ascii_lowercase
-                    return ''.join(random.choice(letters) for z in range(length))
-
-                replacelist = []
-                for x in range(len(most_systematic_list)):
-                    replacelist.append(get_random_string(10))
-
-                #replacement of systematic words with other systematic words
-                with open(reference_space_file, 'r') as file:
-                    filedata = file.read()
-
-                for k in range(len(most_systematic_list)):
-                    filedata = filedata.replace("\n" + str(most_systematic_list[k]) + " ", "\n" + str(replacelist[k]) + " ")
-                    
-                for l in range(len(most_systematic_list)):  
-                    filedata = filedata.replace("\n" + str(replacelist[l]) + " ", "\n" + str(shuffled_list[l]) + " ")
-                    
-                new_reference_space_file = "new_reference_space.txt"
-                with open(os.path.join(fsc_dir_strongvsweak, new_reference_space_file), 'w') as file:
-                    file.write(filedata)  
-
-                #read new randomly shuffled embeddings space
-                new_reference_space = SemanticSpace.from_csv(os.path.join(fsc_dir_strongvsweak, new_reference_space_file), prenorm = True)
-
-                #compute fsc values with the shuffle embedding space
-                produced_t2OSC_ld_shuffled = levenshtein_fsc(produced_ortho2neighbors_ld, embedding_space, new_reference_space)
-
-                values = []
-
-                for word in targets:
-                    values.append(
-                        [word, produced_t2OSC_ld_shuffled[word]]
-                    )
-
-                produced = "produced_OSC_shuffled" + str(j+1)
-
-                df = pd.DataFrame(
-                    data = values,
-                    columns = ["word", produced]
-                )
+if __name__ == '__main__':
+       
+    #ask for the path to the map in which all file will be stored
+    fsc_dir_strongvsweak = input("Please provide a path to a map where all output will be stored\n")
+    if not os.path.exists(fsc_dir_rnd):
+        raise ValueError("This directory does not exist, please provide a valid path!")
 
-                final_df = pd.merge(final_df, df, on = "word")
+    #ask for all files needed for the computations
+    reference_w2v_space_filebase = input("Please provide the path to the directory where all reference w2v spaces are stored\n") 
+    if not os.path.exists(reference_w2v_space_filebase):
+        raise ValueError("This directory does not exist, please provide a valid path!")
 
-            final_df.to_csv(os.path.join(fsc_dir_strongvsweak, filename), index = False, sep = ';')
+    target_w2v_space_filebase = input("Please provide the path to the directory where all target w2v spaces are stored\n") 
+    if not os.path.exists(target_w2v_space_filebase):
+        raise ValueError("This directory does not exist, please provide a valid path!")
 
-        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done with computing for percentage batch {} of {}...".format(n + 1, len(percentage_list))))
+    produced_reference_w2v_filebase = input("Please provide the path to the directory where all produced reference w2v spaces are stored\n") 
+    if not os.path.exists(produced_reference_w2v_filebase):
+        raise ValueError("This directory does not exist, please provide a valid path!")
 
-    print(
-        datetime.now().strftime("%d/%m/%Y %H:%M:%S: Done with computation for batch {} out of {}. \n".format(
-            i+1, len(reference_w2v_filelist
-                        )))
-        )
-            
-            
+    reference_wordcounts_filebase = input("Please provide the path to the directory where all reference wordcounts are stored\n") 
+    if not os.path.exists(reference_wordcounts_filebase):
+        raise ValueError("This directory does not exist, please provide a valid path!")
 
+    target_wordcounts_filebase = input("Please provide the path to the directory where all target wordcounts are stored\n") 
+    if not os.path.exists(target_wordcounts_filebase):
+        raise ValueError("This directory does not exist, please provide a valid path!")
 
+    reference_w2v_filelist = sorted(os.listdir(reference_w2v_space_filebase))
+    target_w2v_filelist = sorted(os.listdir(target_w2v_space_filebase))
+    produced_reference_w2v_filelist = sorted(os.listdir(produced_reference_w2v_filebase))
+    reference_wordcounts_filelist = sorted(os.listdir(reference_wordcounts_filebase))
+    target_wordcounts_filelist = sorted(os.listdir(target_wordcounts_filebase))
 
-    
+    #compute the age bins concurrently, a bin which fails is reported and does not stop the others
+    bins = [
+        {
+            "reference_w2v": os.path.join(reference_w2v_space_filebase, reference_w2v_filelist[i]),
+            "reference_wordcounts": os.path.join(reference_wordcounts_filebase, reference_wordcounts_filelist[i]),
+            "target_w2v": os.path.join(target_w2v_space_filebase, target_w2v_filelist[i]),
+            "target_wordcounts": os.path.join(target_wordcounts_filebase, target_wordcounts_filelist[i]),
+            "produced_reference_w2v": os.path.join(produced_reference_w2v_filebase, produced_reference_w2v_filelist[i]),
+        }
+        for i in range(len(reference_w2v_filelist))
+    ]
+    run_age_bins(
+        partial(compute_age_bin, fsc_dir_strongvsweak = fsc_dir_strongvsweak), bins,
+        processes = processes, memory_budget = memory_budget
+    )
@@ -0,0 +1,214 @@
+import os
+import copy
+import json
+import numpy as np
+from semspaces.space_io import CSVReader
+
+
+"""
+This module stores semantic spaces in a binary format which loads in a fraction of the time needed to parse the
+word2vec-style text files the spaces are distributed in: the words are listed in a .json file, the vectors are stored,
+normalised to unit length, as a float32 .npy matrix which is memory-mapped rather than read, and their original norms
+are stored next to them. The text file is converted the first time it is loaded, and again whenever it changes.
+"""
+
+
+def binary_folder(space_file):
+
+    """
+    :param space_file:  str, the path to a semantic space stored as a word2vec-style text file
+    :return:            str, the path to the folder where the binary version of the space is stored. It is kept in a
+                        '<folder>_binary' directory next to the folder holding the text file rather than inside it, so
+                        that listing the folder of spaces (as the mains do to pair up age bins) only returns text files
+    """
+
+    space_dir, space_name = os.path.split(os.path.abspath(space_file))
+
+    return os.path.join(space_dir + '_binary', os.path.splitext(space_name)[0])
+
+
+def is_converted(space_file):
+
+    """
+    :param space_file:  str, the path to a semantic space stored as a word2vec-style text file
+    :return:            bool, True if a binary version of the space exists and the text file did not change (in size or
+                        modification time) since it was converted
+    """
+
+    manifest_path = os.path.join(binary_folder(space_file), 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return False
+
+    manifest = json.load(open(manifest_path, 'r'))
+    source = os.stat(space_file)
+
+    return manifest['size'] == source.st_size and manifest['mtime_ns'] == source.st_mtime_ns
+
+
+def convert_text_space(space_file, chunk_size=10000):
+
+    """
+    :param space_file:  str, the path to a semantic space stored as a word2vec-style text file (an optional first line
+                        with the number of rows and columns, then one word per line followed by its vector)
+    :param chunk_size:  int, the number of vectors normalised at once
+    :return:            str, the path to the folder where the binary version of the space has been stored
+
+    The text file is parsed exactly as SemanticSpace.from_csv parses it. Rows are normalised in double precision and
+    stored as float32, rows with norm 0 are left as they are, as sklearn's normalize does. The manifest, which marks the
+    conversion as complete, is written last.
+    """
+
+    folder = binary_folder(space_file)
+    os.makedirs(folder, exist_ok=True)
+
+    words, vectors, title, readme = CSVReader.read(space_file, dtype='float64')
+
+    unit_vectors = np.lib.format.open_memmap(
+        os.path.join(folder, 'vectors.npy'), mode='w+', dtype=np.float32, shape=vectors.shape
+    )
+    norms = np.empty(vectors.shape[0], dtype=np.float32)
+    for start in range(0, vectors.shape[0], chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        chunk_norms = np.sqrt(np.einsum('ij,ij->i', chunk, chunk))
+        norms[start:start + chunk_size] = chunk_norms
+        chunk_norms[chunk_norms == 0] = 1
+        unit_vectors[start:start + chunk_size] = chunk / chunk_norms[:, None]
+    unit_vectors.flush()
+    del unit_vectors
+
+    np.save(os.path.join(folder, 'norms.npy'), norms)
+    json.dump(list(words), open(os.path.join(folder, 'words.json'), 'w'))
+
+    source = os.stat(space_file)
+    json.dump(
+        {'size': source.st_size, 'mtime_ns': source.st_mtime_ns, 'shape': list(vectors.shape), 'title': title,
+         'readme': readme},
+        open(os.path.join(folder, 'manifest.json'), 'w')
+    )
+
+    return folder
+
+
+class BinarySpace(object):
+
+    """
+    A semantic space read from the binary format, exposing the words, word2id, vectors, shape, get_vector and
+    included_words attributes of SemanticSpace objects the pipeline relies on.
+    """
+
+    def __init__(self, words, vectors, norms, prenorm=True, title='', readme=''):
+
+        self.words = words
+        self.word2id = {w: i for i, w in enumerate(words)}
+        self._incl_words = set(words)
+        self.norms = norms
+        self.prenorm = prenorm
+        self.vectors = vectors
+        self.shape = vectors.shape
+        self.title = title
+        self.readme = readme
+
+    @classmethod
+    def load(cls, folder, prenorm=True):
+
+        """
+        :param folder:  str, the path to a folder written by convert_text_space
+        :param prenorm: bool, whether the vectors should be normalised to unit length. If True (as all callers do) the
+                        stored matrix is memory-mapped, pages being read from disk only when rows are accessed; if False
+                        the original vectors are rebuilt in memory from the stored norms
+        :return:        BinarySpace object
+        """
+
+        manifest = json.load(open(os.path.join(folder, 'manifest.json'), 'r'))
+        words = json.load(open(os.path.join(folder, 'words.json'), 'r'))
+        vectors = np.load(os.path.join(folder, 'vectors.npy'), mmap_mode='r')
+        norms = np.load(os.path.join(folder, 'norms.npy'))
+        if not prenorm:
+            vectors = vectors * norms[:, None]
+
+        return cls(words, vectors, norms, prenorm=prenorm, title=manifest['title'], readme=manifest['readme'])
+
+    def included_words(self):
+
+        return self._incl_words
+
+    def defined_at(self, element):
+
+        if isinstance(element, str):
+            return element in self._incl_words
+
+        return all(word in self._incl_words for word in element)
+
+    def get_vector(self, element):
+
+        """
+        :param element: str, a word in the space, or a list of words
+        :return:        NumPy 2d array with a single row, the vector of the word or the sum of the vectors of the words
+                        (normalised to unit length if the space is), as returned by SemanticSpace.get_vector. Words are
+                        found through word2id rather than by searching the list of words, but a missing word raises the
+                        same errors: ValueError for a single word (callers rely on it to skip words without a vector),
+                        KeyError for a list of words
+        """
+
+        if isinstance(element, str):
+            if element not in self.word2id:
+                raise ValueError("'{}' is not in the space".format(element))
+            return np.array(self.vectors[self.word2id[element]], dtype=np.float64).reshape(1, -1)
+        elif not isinstance(element, list):
+            raise Exception("An element must be a string or a list")
+
+        vector = np.asarray(self.vectors[[self.word2id[word] for word in element]], dtype=np.float64).sum(axis=0)
+        if self.prenorm:
+            vector = vector / np.linalg.norm(vector)
+
+        return vector.reshape(1, -1)
+
+    def rows(self, words):
+
+        """
+        :param words:   iterable, words in the space
+        :return:        NumPy 1d array, the row of self.vectors storing the vector of each word
+        """
+
+        return np.array([self.word2id[w] for w in words], dtype=np.int64)
+
+    def shuffled(self, words, seed):
+
+        """
+        :param words:   list, words in the space whose vectors are to be shuffled among themselves
+        :param seed:    int, the seed of the random permutation, as in np.random.seed
+        :return:        BinarySpace object where each word in words is paired with the vector of another word in words,
+                        drawn by a random permutation, while all other words keep their own vectors
+
+        The shuffled space is a view: it shares the vectors (and norms) of this space, only its words, word2id and the
+        rows the words are mapped to differ, so no vector is copied and nothing is written to or read from disk.
+        """
+
+        words = list(words)
+        rows = self.rows(words)
+        shuffled_rows = rows[np.random.RandomState(seed).permutation(len(rows))]
+
+        view = copy.copy(self)
+        view.word2id = dict(self.word2id)
+        view.words = list(self.words)
+        for word, row in zip(words, shuffled_rows.tolist()):
+            view.word2id[word] = row
+            view.words[row] = word
+
+        return view
+
+
+def load_space(space_file, prenorm=True):
+
+    """
+    :param space_file:  str, the path to a semantic space stored as a word2vec-style text file
+    :param prenorm:     bool, whether the vectors should be normalised to unit length
+    :return:            BinarySpace object, a drop-in replacement for SemanticSpace.from_csv(space_file, prenorm)
+
+    The text file is converted to the binary format if it has never been, or if it changed since it was.
+    """
+
+    if not is_converted(space_file):
+        convert_text_space(space_file)
+
+    return BinarySpace.load(binary_folder(space_file), prenorm=prenorm)
@@ -1,46 +1,65 @@
+import numpy as np
 from collections import defaultdict
-import multiprocessing as mp
-from scipy.spatial.distance import cosine
-from sklearn.metrics.pairwise import cosine_similarity
 
-target_embeddings = None
-original_embeddings = None
+def rowwise_cosine_similarity(predicted, gold, dtype=None, chunk_size=100000):
 
-def _mp_compute_cosdist(args):
-
-    return compute_cosdist(*args)
+    """
+    :param predicted:   NumPy 2d array of shape (n, dim), or a stack of such arrays of shape (n_stack, n, dim)
+    :param gold:        NumPy 2d array of shape (n, dim), row i of gold is compared to row i of (each array in) predicted
+    :param dtype:       str or NumPy dtype, the type in which to compute the similarities (e.g. float32 to halve the
+                        memory footprint). Default to None keeps the type of the inputs
+    :param chunk_size:  int, number of rows (or stacked arrays) of predicted processed at once
+    :return:            NumPy array of shape predicted.shape[:-1], the cosine similarity of each pair of rows. As in
+                        sklearn's cosine_similarity, rows with zero norm have similarity 0
+    """
 
-def compute_cosdist(i, word):
+    predicted = np.asarray(predicted, dtype=dtype)
+    gold = np.asarray(gold, dtype=dtype)
+    # when a stack of predicted arrays is passed, the gold rows are broadcast against each array of the stack
+    paired = predicted.ndim == gold.ndim
+    gold_norms = np.linalg.norm(gold, axis=-1)
 
-    # cos = float(cosine(target_embeddings[word], original_embeddings.get_vector(word)))
-    cos = float(cosine_similarity(target_embeddings[word], original_embeddings.get_vector(word)))
+    similarities = np.zeros(predicted.shape[:-1], dtype=np.result_type(predicted, gold))
+    for start in range(0, len(predicted), chunk_size):
+        stop = start + chunk_size
+        chunk = predicted[start:stop]
+        chunk_gold = gold[start:stop] if paired else gold
+        chunk_gold_norms = gold_norms[start:stop] if paired else gold_norms
+        norms = np.linalg.norm(chunk, axis=-1) * chunk_gold_norms
+        np.divide(
+            np.einsum('...d,...d->...', chunk, chunk_gold), norms, out=similarities[start:stop], where=norms > 0
+        )
 
-    return word, cos
+    return similarities
 
-def compute_cosine_distance(target_space, original_space, target_vocab, threads = 64):
+def compute_cosine_distance(target_space, original_space, target_vocab, threads = 64, dtype = None, chunk_size = 100000):
 
     """
-    :param target_space:    dict containing the wordvectors of the target vocab computed using LDL
+    :param target_space:    dict containing the wordvectors of the target vocab computed using LDL, or the
+                            (estimated_space, word2row) tuple returned by cross_mapping.cross_mapping_matrix
     :param original_space:  the original SemanticSpace object of the target vocab
     :param target_vocab:    list, target words for which to compute snd.
-    :param threads:         int, the number of cores to use for parallel processing.
+    :param threads:         int, kept for compatibility with existing callers: all similarities are computed in one
+                            vectorised pass (see rowwise_cosine_similarity), which no longer needs a pool of processes
+    :param dtype:           str or NumPy dtype, see rowwise_cosine_similarity
+    :param chunk_size:      int, see rowwise_cosine_similarity
     :return:                dict, mapping words to their respective cosine similarity values. Higher values indicate more similarity
     """
 
-    global target_embeddings
-    global original_embeddings
-
-    target_embeddings = target_space
-    original_embeddings = original_space
-
     word_to_cosdist = defaultdict(float)
-    target_vocab = target_vocab
-
-    with mp.Pool(threads) as pool:
-        outputs = pool.imap(_mp_compute_cosdist, ((i, word) for i, word in enumerate(target_vocab)))
-        for word, cossim in outputs:
-            word_to_cosdist[word] = cossim
+    target_vocab = list(target_vocab)
+    if not target_vocab:
+        return word_to_cosdist
 
-    return word_to_cosdist
+    if isinstance(target_space, tuple):
+        estimated_space, word2row = target_space
+        predicted = estimated_space[[word2row[word] for word in target_vocab]]
+    else:
+        predicted = np.vstack([target_space[word] for word in target_vocab])
+    gold = np.vstack([original_space.get_vector(word) for word in target_vocab])
 
+    similarities = rowwise_cosine_similarity(predicted, gold, dtype=dtype, chunk_size=chunk_size)
+    for word, cossim in zip(target_vocab, similarities):
+        word_to_cosdist[word] = float(cossim)
 
+    return word_to_cosdist
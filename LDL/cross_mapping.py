@@ -1,24 +1,80 @@
+import hashlib
 import numpy as np
 
-def cross_mapping(train_form_matrix, train_semantic_space, test_form_matrix, target_vocab):
+# pseudo-inverses of the form matrices mapped so far, keyed by form_matrix_key: the same form matrix is typically mapped
+# onto many semantic spaces (e.g. permuted or shuffled embeddings), and inverting it dominates the cost of a mapping
+pinv_cache = dict()
+max_cached_inverses = 4
+
+def form_matrix_key(form_matrix):
+
+    """
+    :param form_matrix:     NumPy 2d array
+    :return:                str, digest of the shape, type and values of the matrix
+    """
+
+    form_matrix = np.ascontiguousarray(form_matrix)
+    digest = hashlib.sha1(str((form_matrix.shape, form_matrix.dtype.str)).encode())
+    digest.update(form_matrix.view(np.uint8))
+
+    return digest.hexdigest()
+
+def pseudo_inverse(train_form_matrix):
+
+    """
+    :param train_form_matrix:   NumPy 2d array
+    :return:                    NumPy 2d array, the Moore-Penrose pseudo-inverse of the matrix, computed only the first
+                                time the matrix is seen. The max_cached_inverses most recent inverses are kept
+    """
+
+    key = form_matrix_key(train_form_matrix)
+    try:
+        inverse = pinv_cache.pop(key)
+    except KeyError:
+        inverse = np.linalg.pinv(train_form_matrix)
+        while len(pinv_cache) >= max_cached_inverses:
+            del pinv_cache[next(iter(pinv_cache))]
+    pinv_cache[key] = inverse
+
+    return inverse
+
+def cross_mapping_matrix(train_form_matrix, train_semantic_space, test_form_matrix, target_vocab):
 
     """
     :param train_form_matrix:       NumPy 2d array
     :param train_semantic_space:    NumPy 2d array
-    :param test_form_matrix:        NumPy 2d array
-    :return:                        NumPy 2d array
+    :param test_form_matrix:        NumPy 2d array, one row for each word in target_vocab, in the same order
+    :param target_vocab:            iterable, target words
+    :return estimated_space:        NumPy 2d array, the estimated semantic vector of each target word
+    :return word2row:               dict, mapping each target word to its row in estimated_space
     """
 
-    subset_transform = np.dot(np.linalg.pinv(train_form_matrix), train_semantic_space)
-    #subset_transform = np.nan_to_num(subset_transform)
+    subset_transform = np.dot(pseudo_inverse(train_form_matrix), train_semantic_space)
     estimated_semantic_space = np.dot(test_form_matrix, subset_transform)
-    
-    #print(estimated_semantic_space)
-    
-    space_dict = dict()
-    
-    for i in range(len(estimated_semantic_space)):
-        for word in target_vocab:
-            space_dict[word] = estimated_semantic_space[i].reshape(1,-1)
-
-    return space_dict
\ No newline at end of file
+
+    word2row = {word: i for i, word in enumerate(target_vocab)}
+    if len(word2row) != len(estimated_semantic_space):
+        raise ValueError(
+            "The test form matrix has {} rows, but {} target words were provided".format(
+                len(estimated_semantic_space), len(word2row)
+            )
+        )
+
+    return estimated_semantic_space, word2row
+
+def cross_mapping(train_form_matrix, train_semantic_space, test_form_matrix, target_vocab):
+
+    """
+    :param train_form_matrix:       NumPy 2d array
+    :param train_semantic_space:    NumPy 2d array
+    :param test_form_matrix:        NumPy 2d array, one row for each word in target_vocab, in the same order
+    :param target_vocab:            iterable, target words
+    :return:                        dict, mapping each target word to its estimated semantic vector (a 1 x dim NumPy
+                                    array), see cross_mapping_matrix
+    """
+
+    estimated_semantic_space, word2row = cross_mapping_matrix(
+        train_form_matrix, train_semantic_space, test_form_matrix, target_vocab
+    )
+
+    return {word: estimated_semantic_space[i].reshape(1,-1) for word, i in word2row.items()}
@@ -0,0 +1,104 @@
+import os
+import traceback
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+
+"""
+This module runs the computations of independent age bins concurrently, each in its own process. Bins are started in
+order as long as fewer than the given number of processes are busy and the memory the running bins are expected to need
+fits in the given budget, so that a run over many bins takes roughly as long as its slowest bins rather than as long as
+all of them together. A bin which fails is reported and does not stop the others. The workers are not daemonic, so a
+bin can still spread its own computations over a multiprocessing pool.
+"""
+
+
+def estimate_bin_memory(bin_files, factor=1.0):
+
+    """
+    :param bin_files:   dict, mapping names to the paths of the files an age bin reads
+    :param factor:      float, the ratio between the memory a bin needs and the size of its input files on disk
+    :return:            int, the number of bytes the bin is expected to need
+    """
+
+    return int(factor * sum(os.path.getsize(path) for path in bin_files.values() if os.path.exists(path)))
+
+
+def run_age_bins(compute_bin, bins, processes=4, memory_budget=None, bin_memory=None):
+
+    """
+    :param compute_bin:     function, computing the measures of an age bin and writing them to file. It is called in a
+                            worker process with an element of bins, so it must be defined at module level (and be
+                            picklable, e.g. a functools.partial of such a function)
+    :param bins:            list, the argument of compute_bin for each age bin, e.g. a dict of the paths to its files
+    :param processes:       int, the maximum number of age bins computed at the same time
+    :param memory_budget:   int, the number of bytes the age bins computed at the same time may need together. Default
+                            to None means only the number of processes limits how many bins run at once. A bin which
+                            alone exceeds the budget is run when no other bin is running
+    :param bin_memory:      list, the number of bytes each age bin is expected to need. Default to None estimates it
+                            from the size of its input files (see estimate_bin_memory), which requires the elements of
+                            bins to be dictionaries of paths
+    :return results:        dict, mapping the index of each age bin which was computed to what compute_bin returned
+    :return failures:       dict, mapping the index of each age bin which failed to the traceback of the error
+    """
+
+    if memory_budget is not None and bin_memory is None:
+        bin_memory = [estimate_bin_memory(bin_files) for bin_files in bins]
+
+    results, failures = dict(), dict()
+    pending = list(range(len(bins)))
+    running = dict()
+    executor = ProcessPoolExecutor(max_workers=processes)
+
+    def log(message):
+        print(datetime.now().strftime("%d/%m/%Y %H:%M:%S: ") + message)
+
+    try:
+        while pending or running:
+            # start the next age bins in order, as long as a process is free and the bin fits in the memory budget
+            while pending and len(running) < processes:
+                i = pending[0]
+                if memory_budget is not None and running:
+                    in_use = sum(bin_memory[j] for j in running.values())
+                    if in_use + bin_memory[i] > memory_budget:
+                        break
+                pending.pop(0)
+                running[executor.submit(compute_bin, bins[i])] = i
+                log("Started age bin {} ({} running, {} waiting).".format(i + 1, len(running), len(pending)))
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                i = running.pop(future)
+                try:
+                    results[i] = future.result()
+                    log("Done with age bin {} ({} of {} done, {} failed).".format(
+                        i + 1, len(results), len(bins), len(failures))
+                    )
+                except BrokenProcessPool:
+                    # a worker died (e.g. killed for running out of memory), which breaks the whole pool
+                    broken = True
+                    failures[i] = traceback.format_exc()
+                    log("Age bin {} failed: its process terminated abruptly.".format(i + 1))
+                except Exception:
+                    failures[i] = traceback.format_exc()
+                    log("Age bin {} failed:\n{}".format(i + 1, failures[i]))
+
+            if broken:
+                # the bins which were still running died with the pool: they are reported, the remaining ones run on a
+                # new pool
+                for future, i in running.items():
+                    failures[i] = "The process computing this age bin terminated abruptly."
+                    log("Age bin {} failed: its process terminated abruptly.".format(i + 1))
+                running = dict()
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=processes)
+    finally:
+        executor.shutdown()
+
+    log("Done with {} of {} age bins.".format(len(results), len(bins)))
+    if failures:
+        log("The following age bins failed: {}.".format(", ".join(str(i + 1) for i in sorted(failures))))
+
+    return results, failures
@@ -1,24 +1,137 @@
+import hashlib
 import numpy as np
+from cosine_distance import rowwise_cosine_similarity
+
+# pseudo-inverses of the form matrices mapped so far, keyed by form_matrix_key: the same form matrix is typically mapped
+# onto many semantic spaces (e.g. permuted or shuffled embeddings), and inverting it dominates the cost of a mapping
+pinv_cache = dict()
+max_cached_inverses = 4
+
+def form_matrix_key(form_matrix):
+
+    """
+    :param form_matrix:     NumPy 2d array
+    :return:                str, digest of the shape, type and values of the matrix
+    """
+
+    form_matrix = np.ascontiguousarray(form_matrix)
+    digest = hashlib.sha1(str((form_matrix.shape, form_matrix.dtype.str)).encode())
+    digest.update(form_matrix.view(np.uint8))
+
+    return digest.hexdigest()
+
+def pseudo_inverse(train_form_matrix):
+
+    """
+    :param train_form_matrix:   NumPy 2d array
+    :return:                    NumPy 2d array, the Moore-Penrose pseudo-inverse of the matrix, computed only the first
+                                time the matrix is seen. The max_cached_inverses most recent inverses are kept
+    """
+
+    key = form_matrix_key(train_form_matrix)
+    try:
+        inverse = pinv_cache.pop(key)
+    except KeyError:
+        inverse = np.linalg.pinv(train_form_matrix)
+        while len(pinv_cache) >= max_cached_inverses:
+            del pinv_cache[next(iter(pinv_cache))]
+    pinv_cache[key] = inverse
+
+    return inverse
+
+def cross_mapping_matrix(train_form_matrix, train_semantic_space, test_form_matrix, target_vocab):
+
+    """
+    :param train_form_matrix:       NumPy 2d array
+    :param train_semantic_space:    NumPy 2d array
+    :param test_form_matrix:        NumPy 2d array, one row for each word in target_vocab, in the same order
+    :param target_vocab:            iterable, target words
+    :return estimated_space:        NumPy 2d array, the estimated semantic vector of each target word
+    :return word2row:               dict, mapping each target word to its row in estimated_space
+    """
+
+    subset_transform = np.dot(pseudo_inverse(train_form_matrix), train_semantic_space)
+    estimated_semantic_space = np.dot(test_form_matrix, subset_transform)
+
+    word2row = {word: i for i, word in enumerate(target_vocab)}
+    if len(word2row) != len(estimated_semantic_space):
+        raise ValueError(
+            "The test form matrix has {} rows, but {} target words were provided".format(
+                len(estimated_semantic_space), len(word2row)
+            )
+        )
+
+    return estimated_semantic_space, word2row
 
 def cross_mapping(train_form_matrix, train_semantic_space, test_form_matrix, target_vocab):
 
+    """
+    :param train_form_matrix:       NumPy 2d array
+    :param train_semantic_space:    NumPy 2d array
+    :param test_form_matrix:        NumPy 2d array, one row for each word in target_vocab, in the same order
+    :param target_vocab:            iterable, target words
+    :return:                        dict, mapping each target word to its estimated semantic vector (a 1 x dim NumPy
+                                    array), see cross_mapping_matrix
+    """
+
+    estimated_semantic_space, word2row = cross_mapping_matrix(
+        train_form_matrix, train_semantic_space, test_form_matrix, target_vocab
+    )
+
+    return {word: estimated_semantic_space[i].reshape(1,-1) for word, i in word2row.items()}
+
+def random_permutations(n_rows, seeds):
+
+    """
+    :param n_rows:  int, number of rows to permute
+    :param seeds:   iterable, one random seed for each permutation
+    :return:        NumPy 2d array, one permutation of range(n_rows) for each seed, i.e. the permutation
+                    np.random.permutation returns after np.random.seed(seed)
+    """
+
+    return np.stack([np.random.RandomState(seed).permutation(n_rows) for seed in seeds])
+
+def permutation_cross_mapping(train_form_matrix, train_semantic_space, test_form_matrix, permutations, batch_size=10):
+
     """
     :param train_form_matrix:       NumPy 2d array
     :param train_semantic_space:    NumPy 2d array
     :param test_form_matrix:        NumPy 2d array
-    :return:                        NumPy 2d array
+    :param permutations:            NumPy 2d array, each row a permutation of the rows of train_semantic_space (see
+                                    random_permutations), or more generally the rows of train_semantic_space to pair
+                                    with the rows of train_form_matrix, e.g. as returned by BinarySpace.shuffled().rows
+    :param batch_size:              int, number of permutations mapped at once
+    :return:                        generator, yielding for each batch of permutations a NumPy 3d array of shape
+                                    (n_permutations, n_targets, dim) with the semantic vectors estimated from forms when
+                                    the forms of the training words are paired with permuted semantic vectors
+
+    Only the semantic side is permuted, so the form matrices are factored once: the test forms are projected onto the
+    pseudo-inverse of the training forms, and every permutation reduces to one batched matrix product.
     """
 
-    subset_transform = np.dot(np.linalg.pinv(train_form_matrix), train_semantic_space)
-    #subset_transform = np.nan_to_num(subset_transform)
-    estimated_semantic_space = np.dot(test_form_matrix, subset_transform)
-    
-    #print(estimated_semantic_space)
-    
-    space_dict = dict()
-    
-    for i in range(len(estimated_semantic_space)):
-        for word in target_vocab:
-            space_dict[word] = estimated_semantic_space[i].reshape(1,-1)
-
-    return space_dict
\ No newline at end of file
+    form_transform = np.dot(test_form_matrix, pseudo_inverse(train_form_matrix))
+
+    for start in range(0, len(permutations), batch_size):
+        yield np.matmul(form_transform, train_semantic_space[permutations[start:start + batch_size]])
+
+def permutation_cosine_similarities(train_form_matrix, train_semantic_space, test_form_matrix, test_semantic_space,
+                                    permutations, batch_size=10):
+
+    """
+    :param train_form_matrix:       NumPy 2d array
+    :param train_semantic_space:    NumPy 2d array
+    :param test_form_matrix:        NumPy 2d array
+    :param test_semantic_space:     NumPy 2d array, the true semantic vectors of the test words, in the order of the
+                                    rows of test_form_matrix
+    :param permutations:            NumPy 2d array, see permutation_cross_mapping
+    :param batch_size:              int, number of permutations mapped at once
+    :return:                        NumPy 2d array of shape (n_permutations, n_targets), the cosine similarity between
+                                    the true and estimated semantic vector of each test word under each permutation
+    """
+
+    return np.concatenate([
+        rowwise_cosine_similarity(estimated, test_semantic_space)
+        for estimated in permutation_cross_mapping(
+            train_form_matrix, train_semantic_space, test_form_matrix, permutations, batch_size=batch_size
+        )
+    ])
@@ -4,8 +4,11 @@ __author__ = 'GCassani'
    outcomes using naïve discriminative learning (can be called from command line)"""
 
 import os
+import re
 import glob
 from rescorla_wagner.ndl import ndl
+from rescorla_wagner.age_bins import ndl_age_bins
+from rescorla_wagner.sweep import ndl_sweep, parameter_grid
 
 
 def main():
@@ -25,9 +28,22 @@ def main():
 
     lam = 1.0 #input("Specify the value of the lambda parameter (default: 1.0).")
 
-  
+    age_bins = False #set to True if the input is a folder of NDL_bin_i.json files, one per age bin (see helper_functions.make_NDL_training_data), to train incrementally over the age bins
 
-    ndl(input_corpus, longitudinal, alpha, beta, lam)
+    sweep = False #set to True to estimate one matrix for every combination of the parameter values below instead
+
+    alphas, betas, lams = [0.01, 0.05, 0.1], [0.01, 0.05, 0.1], [1.0]
+
+    threads = 4 #number of parameter combinations estimated at the same time in a sweep
+
+    if age_bins:
+        bin_files = sorted(glob.glob(os.path.join(input_corpus, 'NDL_bin_*.json')),
+                           key=lambda f: int(re.findall(r'\d+', os.path.basename(f))[-1]))
+        ndl_age_bins(bin_files, input_corpus, alpha, beta, lam)
+    elif sweep:
+        ndl_sweep(input_corpus, parameter_grid(alphas, betas, lams), threads=threads)
+    else:
+        ndl(input_corpus, longitudinal, alpha, beta, lam)
 
 ########################################################################################################################
 
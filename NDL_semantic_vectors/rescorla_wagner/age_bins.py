@@ -0,0 +1,121 @@
+"""Functions to estimate cue-outcome associations incrementally over a corpus split into consecutive age bins"""
+
+import os
+import json
+import numpy as np
+from time import strftime
+from rescorla_wagner.compiled_corpus import encode_corpus
+from rescorla_wagner.compute_activations import rescorla_wagner_updates
+
+
+def bin_paths(output_folder, i):
+
+    """
+    :param output_folder:       the path to the folder where the matrices are stored
+    :param i:                   the index of an age bin
+    :return matrix_path:        the path to the matrix of associations estimated up to the end of the age bin
+    :return cue_indices:        the path to the .json file mapping cues to rows of the matrix
+    :return outcome_indices:    the path to the .json file mapping outcomes to columns of the matrix
+    """
+
+    return (os.path.join(output_folder, 'associationMatrix_bin' + str(i) + '.npy'),
+            os.path.join(output_folder, 'cueIDs_bin' + str(i) + '.json'),
+            os.path.join(output_folder, 'outcomeIDs_bin' + str(i) + '.json'))
+
+
+def expand_weights(weight_matrix, cues2ids, outcomes2ids, new_cues2ids, new_outcomes2ids):
+
+    """
+    :param weight_matrix:       a NumPy 2d array, the matrix of associations indexed by cues2ids and outcomes2ids
+    :param cues2ids:            a dictionary mapping cues to rows of weight_matrix
+    :param outcomes2ids:        a dictionary mapping outcomes to columns of weight_matrix
+    :param new_cues2ids:        a dictionary mapping a superset of the cues to rows of the expanded matrix
+    :param new_outcomes2ids:    a dictionary mapping a superset of the outcomes to columns of the expanded matrix
+    :return:                    a NumPy 2d array, the expanded matrix, where every known association is moved to the row
+                                and column of its cue and outcome, and associations involving new cues or outcomes are 0
+
+    Since the association between a cue and an outcome stays 0 until both have been experienced, learning on the
+    expanded matrix gives exactly the same weights as learning from the start with the larger vocabulary.
+    """
+
+    expanded = np.zeros((len(new_cues2ids), len(new_outcomes2ids)), dtype=weight_matrix.dtype)
+    rows = np.empty(len(cues2ids), dtype=np.int64)
+    for cue, idx in cues2ids.items():
+        rows[idx] = new_cues2ids[cue]
+    columns = np.empty(len(outcomes2ids), dtype=np.int64)
+    for outcome, idx in outcomes2ids.items():
+        columns[idx] = new_outcomes2ids[outcome]
+    expanded[np.ix_(rows, columns)] = weight_matrix
+
+    return expanded
+
+
+def ndl_age_bins(bin_files, output_folder, alpha=0.01, beta=0.01, lam=1.0, dtype=np.float64, use_numba=None):
+
+    """
+    :param bin_files:       a list of paths to .json corpora (see compute_activations.compute_activations), one for each
+                            age bin in chronological order, each containing only the learning events of its age bin
+                            (see helper_functions.make_NDL_training_data with cumulative=False)
+    :param output_folder:   the path to the folder where the matrices are stored
+    :param alpha:           cue salience
+    :param beta:            learning rate
+    :param lam:             maximum amount of association that an outcome can receive from all the cues
+    :param dtype:           the NumPy type of the matrices of associations
+    :param use_numba:       a boolean, whether to learn using the compiled Numba kernel. Default to None means the
+                            kernel is used if Numba is installed
+    :return file_paths:     a list with, for each age bin, the paths returned by bin_paths
+
+    The weights estimated up to the end of an age bin are the starting point for the next one, which is only trained on
+    its own learning events, after rows and columns have been added for the cues and outcomes it introduces. The matrix
+    written for age bin i, together with the mappings of cues and outcomes to its rows and columns (in alphabetical
+    order, as for any corpus), is therefore identical to the one obtained by training from scratch on the cumulative
+    corpus of age bins 0 to i, but the whole sequence costs a single pass over the corpus. If the matrices of the first
+    age bins already exist, learning resumes after the last of them.
+    """
+
+    file_paths = [bin_paths(output_folder, i) for i in range(len(bin_files))]
+    learning_rate = alpha * beta
+
+    # resume after the last age bin (in an unbroken sequence from the first) whose matrix has already been written
+    done = 0
+    while done < len(bin_files) and all(os.path.exists(f_path) for f_path in file_paths[done]):
+        done += 1
+
+    if done:
+        matrix_path, cue_indices, outcome_indices = file_paths[done - 1]
+        weight_matrix = np.load(matrix_path).astype(dtype)
+        cues2ids = json.load(open(cue_indices, 'r'))
+        outcomes2ids = json.load(open(outcome_indices, 'r'))
+        print(strftime("%Y-%m-%d %H:%M:%S") + ": resumed after age bin %d (%s)." % (done - 1, matrix_path))
+    else:
+        weight_matrix = np.zeros((0, 0), dtype=dtype)
+        cues2ids, outcomes2ids = {}, {}
+
+    for i in range(done, len(bin_files)):
+        corpus = json.load(open(bin_files[i], 'r'))
+
+        # add the cues and outcomes introduced by the age bin, keeping both vocabularies in alphabetical order
+        cues = set(cues2ids)
+        outcomes = set(outcomes2ids)
+        for trial_cues, trial_outcomes in zip(corpus[0], corpus[1]):
+            cues.update(trial_cues)
+            outcomes.update(trial_outcomes)
+        new_cues2ids = {k: idx for idx, k in enumerate(sorted(cues))}
+        new_outcomes2ids = {k: idx for idx, k in enumerate(sorted(outcomes))}
+
+        weight_matrix = expand_weights(weight_matrix, cues2ids, outcomes2ids, new_cues2ids, new_outcomes2ids)
+        cues2ids, outcomes2ids = new_cues2ids, new_outcomes2ids
+
+        encoded_corpus = encode_corpus(corpus, cues2ids, outcomes2ids)
+        del corpus
+        rescorla_wagner_updates(encoded_corpus, weight_matrix, learning_rate, lam, use_numba=use_numba)
+
+        matrix_path, cue_indices, outcome_indices = file_paths[i]
+        np.save(matrix_path, weight_matrix)
+        json.dump(cues2ids, open(cue_indices, 'w'))
+        json.dump(outcomes2ids, open(outcome_indices, 'w'))
+
+        print(strftime("%Y-%m-%d %H:%M:%S") + ": age bin %d of %d processed (%d cues, %d outcomes)."
+              % (i + 1, len(bin_files), len(cues2ids), len(outcomes2ids)))
+
+    return file_paths
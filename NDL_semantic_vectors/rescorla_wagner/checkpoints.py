@@ -0,0 +1,169 @@
+"""Functions to write matrices of cue-outcome associations to file while learning, and to resume learning from them"""
+
+import os
+import json
+import numpy as np
+from scipy import sparse
+
+
+CHECKPOINT_FORMATS = ('dense', 'float32', 'sparse', 'sparse_delta')
+
+
+def checkpoint_extension(checkpoint_format):
+
+    """
+    :param checkpoint_format:   a string, one of CHECKPOINT_FORMATS
+    :return:                    the extension of the files storing checkpoints in the given format: dense matrices are
+                                stored as .npy files, sparse matrices and sparse deltas as .npz archives
+    """
+
+    if checkpoint_format not in CHECKPOINT_FORMATS:
+        raise ValueError("Unknown checkpoint format '%s': choose one of %s." % (checkpoint_format, CHECKPOINT_FORMATS))
+
+    return 'npz' if checkpoint_format in ('sparse', 'sparse_delta') else 'npy'
+
+
+def state_path(matrix_path):
+
+    """
+    :param matrix_path: the path to a file storing a matrix of cue-outcome associations
+    :return:            the path to the .json file storing the state of learning when the matrix was written
+    """
+
+    return os.path.splitext(matrix_path)[0] + '.json'
+
+
+def save_checkpoint(matrix_path, weight_matrix, offset, total_events, checkpoint_format='dense', changed_rows=None,
+                    base_path=None):
+
+    """
+    :param matrix_path:         the path where the matrix of cue-outcome associations has to be saved
+    :param weight_matrix:       a NumPy 2d array, the matrix of cue-outcome associations
+    :param offset:              the number of learning events processed to estimate the matrix
+    :param total_events:        the number of learning events in the whole corpus
+    :param checkpoint_format:   a string, one of CHECKPOINT_FORMATS: 'dense' saves the matrix as is, 'float32' saves it
+                                as single precision floats, 'sparse' saves its non-zero weights as a scipy.sparse CSR
+                                matrix, 'sparse_delta' only saves the rows which changed since the checkpoint stored at
+                                base_path (or all non-zero rows if base_path is None)
+    :param changed_rows:        a NumPy 1d array of booleans, True for the rows which changed since the checkpoint at
+                                base_path. Only needed for sparse deltas
+    :param base_path:           the path to the checkpoint sparse deltas are computed against
+
+    Next to the matrix, a .json file records the event offset and how the matrix was stored, so that learning can be
+    resumed from it (see latest_checkpoint).
+    """
+
+    if checkpoint_format == 'sparse_delta':
+        if base_path is None:
+            changed_rows = np.any(weight_matrix != 0, axis=1)
+        rows = np.flatnonzero(changed_rows)
+        # rows are stored with their new values rather than as differences, so that the matrix is rebuilt exactly
+        np.savez(matrix_path, rows=rows, values=weight_matrix[rows], shape=np.array(weight_matrix.shape))
+    elif checkpoint_format == 'sparse':
+        sparse.save_npz(matrix_path, sparse.csr_matrix(weight_matrix))
+    elif checkpoint_format == 'float32':
+        np.save(matrix_path, weight_matrix.astype(np.float32))
+    else:
+        np.save(matrix_path, weight_matrix)
+
+    state = {
+        'offset': int(offset), 'total_events': int(total_events), 'format': checkpoint_format,
+        'dtype': str(weight_matrix.dtype), 'base': os.path.basename(base_path) if base_path else None
+    }
+    json.dump(state, open(state_path(matrix_path), 'w'))
+
+
+def load_association_matrix(matrix_path, dense=True, mmap_mode=None):
+
+    """
+    :param matrix_path: the path to a file written by save_checkpoint (or any .npy file storing a matrix)
+    :param dense:       a boolean. If False, matrices stored in the 'sparse' and 'sparse_delta' formats are returned
+                        as scipy.sparse CSR matrices rather than as NumPy arrays, so that they are never densified
+    :param mmap_mode:   passed to np.load for matrices stored in .npy files, e.g. 'r' to memory-map them instead of
+                        reading them into memory
+    :return:            the matrix of cue-outcome associations. Sparse deltas are applied on top of the checkpoints they
+                        were computed against. .npz files without a state file are read as scipy.sparse matrices
+    """
+
+    if not matrix_path.endswith('.npz'):
+        return np.load(matrix_path, mmap_mode=mmap_mode)
+
+    if os.path.exists(state_path(matrix_path)):
+        state = json.load(open(state_path(matrix_path), 'r'))
+    else:
+        state = {'format': 'sparse', 'base': None}
+    if state['format'] == 'sparse':
+        weight_matrix = sparse.load_npz(matrix_path).tocsr()
+        return weight_matrix.toarray() if dense else weight_matrix
+    if state['format'] != 'sparse_delta':
+        raise ValueError("Unknown format '%s' for the association matrix %s." % (state['format'], matrix_path))
+
+    delta = np.load(matrix_path)
+    if not dense:
+        return _apply_sparse_delta(delta, matrix_path, state['base'], mmap_mode)
+
+    if state['base']:
+        weight_matrix = load_association_matrix(os.path.join(os.path.dirname(matrix_path), state['base']))
+        weight_matrix = weight_matrix.astype(delta['values'].dtype, copy=False)
+    else:
+        weight_matrix = np.zeros(tuple(delta['shape']), dtype=delta['values'].dtype)
+    weight_matrix[delta['rows']] = delta['values']
+
+    return weight_matrix
+
+
+def _apply_sparse_delta(delta, matrix_path, base, mmap_mode=None, chunk_rows=1000):
+
+    # the rows stored in the delta replace those of the base matrix, loaded as a CSR matrix as well: the rows which did
+    # not change are kept by a diagonal selection and the changed ones are scattered in by a sparse product
+    n_rows = int(delta['shape'][0])
+    rows, values = delta['rows'], sparse.csr_matrix(delta['values'])
+    scatter = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=values.dtype), (rows, np.arange(len(rows)))), shape=(n_rows, len(rows))
+    )
+    changed = scatter @ values
+    if not base:
+        return changed.tocsr()
+
+    weight_matrix = load_association_matrix(
+        os.path.join(os.path.dirname(matrix_path), base), dense=False, mmap_mode=mmap_mode
+    )
+    if not sparse.issparse(weight_matrix):
+        # dense base matrices (possibly memory-mapped) are converted in chunks of rows
+        weight_matrix = sparse.vstack([
+            sparse.csr_matrix(weight_matrix[start:start + chunk_rows]) for start in range(0, n_rows, chunk_rows)
+        ], format='csr')
+    weight_matrix = weight_matrix.astype(values.dtype)
+    unchanged = np.ones(n_rows, dtype=values.dtype)
+    unchanged[rows] = 0
+    weight_matrix = sparse.diags(unchanged) @ weight_matrix + changed
+    weight_matrix.eliminate_zeros()
+
+    return weight_matrix.tocsr()
+
+
+def latest_checkpoint(output_files, offsets, total_events, before):
+
+    """
+    :param output_files:    a dictionary mapping time indices to the file paths where matrices are stored
+    :param offsets:         a dictionary mapping the same time indices to the number of learning events processed at
+                            that time index
+    :param total_events:    the number of learning events in the corpus
+    :param before:          the event offset of the earliest matrix which still needs to be estimated
+    :return:                the time index of the latest existing matrix learning can be resumed from, or None if no
+                            such matrix exists. Matrices whose state file shows they were estimated on a corpus of
+                            different length are not considered
+    """
+
+    latest = None
+    for idx, f_path in output_files.items():
+        if offsets[idx] > before or not os.path.exists(f_path):
+            continue
+        if os.path.exists(state_path(f_path)):
+            state = json.load(open(state_path(f_path), 'r'))
+            if state['total_events'] != total_events or state['offset'] != offsets[idx]:
+                continue
+        if latest is None or offsets[idx] > offsets[latest]:
+            latest = idx
+
+    return latest
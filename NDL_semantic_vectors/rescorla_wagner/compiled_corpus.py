@@ -0,0 +1,157 @@
+"""Functions to compile a corpus of learning events into integer-coded, memory-mapped arrays and to read it back"""
+
+import os
+import json
+import numpy as np
+from rescorla_wagner.cues_outcomes import collect_cues_and_outcomes
+
+
+ARRAYS = ('cues', 'cue_offsets', 'unique_cues', 'unique_cue_offsets', 'outcomes', 'outcome_offsets')
+
+
+def encode_corpus(corpus, cues2ids, outcomes2ids):
+
+    """
+    :param corpus:          two lists of lists, the first encoding learning events into their cues and the second
+                            encoding the same learning events into their outcomes (see compute_activations)
+    :param cues2ids:        a dictionary mapping each cue in the corpus to its row in the matrix of associations
+    :param outcomes2ids:    a dictionary mapping each outcome in the corpus to its column in the matrix of associations
+    :return encoded:        a dictionary of NumPy arrays encoding the learning events in compressed sparse row fashion:
+                            the cues of event i are cues[cue_offsets[i]:cue_offsets[i+1]], repeated as many times as
+                            they occur in the event, the distinct cues are
+                            unique_cues[unique_cue_offsets[i]:unique_cue_offsets[i+1]], and the distinct outcomes are
+                            outcomes[outcome_offsets[i]:outcome_offsets[i+1]]
+    """
+
+    cues, unique_cues, outcomes = [], [], []
+    cue_offsets, unique_cue_offsets, outcome_offsets = [0], [0], [0]
+
+    for trial_cues, trial_outcomes in zip(corpus[0], corpus[1]):
+        trial_cue_ids = [cues2ids[cue] for cue in trial_cues]
+        cues.extend(trial_cue_ids)
+        unique_cues.extend(dict.fromkeys(trial_cue_ids))
+        outcomes.extend({outcomes2ids[outcome] for outcome in trial_outcomes})
+        cue_offsets.append(len(cues))
+        unique_cue_offsets.append(len(unique_cues))
+        outcome_offsets.append(len(outcomes))
+
+    return {
+        'cues': np.array(cues, dtype=np.int64), 'cue_offsets': np.array(cue_offsets, dtype=np.int64),
+        'unique_cues': np.array(unique_cues, dtype=np.int64),
+        'unique_cue_offsets': np.array(unique_cue_offsets, dtype=np.int64),
+        'outcomes': np.array(outcomes, dtype=np.int64), 'outcome_offsets': np.array(outcome_offsets, dtype=np.int64)
+    }
+
+
+def compiled_folder(input_file):
+
+    """
+    :param input_file:  the path to a .json corpus (see compute_activations.compute_activations)
+    :return:            the path to the folder where the compiled version of the corpus is stored
+    """
+
+    return os.path.splitext(input_file)[0] + '_compiled'
+
+
+def is_compiled(input_file):
+
+    """
+    :param input_file:  the path to a .json corpus
+    :return:            a boolean, True if a compiled version of the corpus exists and the corpus did not change (in
+                        size or modification time) since it was compiled
+    """
+
+    manifest_path = os.path.join(compiled_folder(input_file), 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return False
+
+    manifest = json.load(open(manifest_path, 'r'))
+    source = os.stat(input_file)
+
+    return manifest['size'] == source.st_size and manifest['mtime_ns'] == source.st_mtime_ns
+
+
+def compile_corpus(input_file):
+
+    """
+    :param input_file:  the path to a .json corpus (see compute_activations.compute_activations)
+    :return:            the path to the folder where the compiled corpus has been stored
+
+    This is the only step which reads the .json corpus: the mapping of cues and outcomes to numerical indices is
+    collected (unless cueIDs.json and outcomeIDs.json already exist next to the corpus, in which case they are reused)
+    and written next to the corpus, and the learning events are encoded as integer arrays (see encode_corpus), each
+    stored in a .npy file in the compiled folder, together with a manifest recording the size and modification time of
+    the corpus they were compiled from.
+    """
+
+    folder = os.path.dirname(input_file)
+    cue_indices = os.path.join(folder, 'cueIDs.json')
+    outcome_indices = os.path.join(folder, 'outcomeIDs.json')
+
+    corpus = json.load(open(input_file, 'r'))
+
+    if os.path.exists(cue_indices) and os.path.exists(outcome_indices):
+        cues2ids = json.load(open(cue_indices, 'r'))
+        outcomes2ids = json.load(open(outcome_indices, 'r'))
+    else:
+        # get two dictionaries mapping each cue and each outcome from the input corpus to a unique numerical index
+        cues2ids, outcomes2ids = collect_cues_and_outcomes(corpus)
+        json.dump(cues2ids, open(cue_indices, 'w'))
+        json.dump(outcomes2ids, open(outcome_indices, 'w'))
+
+    encoded_corpus = encode_corpus(corpus, cues2ids, outcomes2ids)
+    del corpus
+
+    output_folder = compiled_folder(input_file)
+    os.makedirs(output_folder, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(output_folder, name + '.npy'), encoded_corpus[name])
+
+    source = os.stat(input_file)
+    manifest = {
+        'size': source.st_size, 'mtime_ns': source.st_mtime_ns, 'n_events': len(encoded_corpus['cue_offsets']) - 1,
+        'n_cues': len(cues2ids), 'n_outcomes': len(outcomes2ids)
+    }
+    # the manifest is written last, so that a compilation which did not complete is never taken as valid
+    json.dump(manifest, open(os.path.join(output_folder, 'manifest.json'), 'w'))
+
+    return output_folder
+
+
+def load_compiled_corpus(folder):
+
+    """
+    :param folder:              the path to a folder created by compile_corpus
+    :return encoded_corpus:     a dictionary of NumPy arrays, as returned by encode_corpus, memory-mapped from disk: only
+                                the parts of the corpus which are accessed are read, so loading is immediate and memory
+                                use does not grow with the size of the corpus
+    :return n_cues:             the number of distinct cues in the corpus
+    :return n_outcomes:         the number of distinct outcomes in the corpus
+    """
+
+    manifest = json.load(open(os.path.join(folder, 'manifest.json'), 'r'))
+    encoded_corpus = {
+        name: np.asarray(np.load(os.path.join(folder, name + '.npy'), mmap_mode='r')) for name in ARRAYS
+    }
+
+    return encoded_corpus, manifest['n_cues'], manifest['n_outcomes']
+
+
+def compiled_frequencies(folder, target):
+
+    """
+    :param folder:          the path to a folder created by compile_corpus
+    :param target:          a string, either 'cues' or 'outcomes'
+    :return:                a NumPy 1d array with the number of learning events each cue (or outcome) occurs in, indexed
+                            by the numerical indices in cueIDs.json (or outcomeIDs.json). As in cues_outcomes.frequency,
+                            items occurring more than once in an event are only counted once
+    """
+
+    encoded_corpus, n_cues, n_outcomes = load_compiled_corpus(folder)
+
+    if target == 'cues':
+        return np.bincount(encoded_corpus['unique_cues'], minlength=n_cues)
+    elif target == 'outcomes':
+        return np.bincount(encoded_corpus['outcomes'], minlength=n_outcomes)
+    else:
+        raise ValueError("Please specify the target items to be counted: either 'cues' or 'outcomes'.")
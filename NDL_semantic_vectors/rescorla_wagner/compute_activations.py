@@ -3,40 +3,105 @@ __author__ = 'GCassani'
 """Function to estimate cue-outcome associations given a corpus"""
 
 import os
-import json
 import numpy as np
 from time import strftime
-#from cues_outcomes import get_cues_and_outcomes
-
-def get_cues_and_outcomes(input_file):
+from rescorla_wagner.compiled_corpus import compile_corpus, load_compiled_corpus, is_compiled, compiled_folder
+from rescorla_wagner.checkpoints import save_checkpoint, load_association_matrix, latest_checkpoint
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+
+    @njit(cache=True)
+    def _numba_updates(cues, cue_offsets, unique_cues, unique_cue_offsets, outcomes, outcome_offsets,
+                       weight_matrix, learning_rate, lam, start, stop):
+
+        n_outcomes = weight_matrix.shape[1]
+        total_v = np.empty(n_outcomes, dtype=weight_matrix.dtype)
+
+        for i in range(start, stop):
+            total_v[:] = 0
+            for c in range(cue_offsets[i], cue_offsets[i + 1]):
+                row = weight_matrix[cues[c]]
+                for j in range(n_outcomes):
+                    total_v[j] += row[j]
+            for j in range(n_outcomes):
+                total_v[j] = -total_v[j]
+            for o in range(outcome_offsets[i], outcome_offsets[i + 1]):
+                total_v[outcomes[o]] += lam
+            for j in range(n_outcomes):
+                total_v[j] *= learning_rate
+            for c in range(unique_cue_offsets[i], unique_cue_offsets[i + 1]):
+                row = weight_matrix[unique_cues[c]]
+                for j in range(n_outcomes):
+                    row[j] += total_v[j]
+
+def rescorla_wagner_updates(encoded_corpus, weight_matrix, learning_rate, lam, start=0, stop=None, use_numba=None):
 
     """
-    :param input_file:      a string indicating the path to the corpus to be considered: it is assumed to be a .json
-                            file consisting of two lists of lists: the first encodes learning events into their
-                            consistuent phonetic cues, the second encodes the same learning events into their meaning
-                            units. Each learning event is a list nested in the two main lists.
-                            outcomes; each of the two may consists of multiple, comma-separated strings
-    :return cue2ids:        a dictionary mapping each of the strings found in the cues fields to a numerical index
-    :return outcome2ids:    a dictionary mapping each of the strings found in the outcomes fields to a numerical index
+    :param encoded_corpus:  a dictionary of NumPy arrays, as returned by compiled_corpus.encode_corpus
+    :param weight_matrix:   a NumPy 2d array with as many rows as there are cues and as many columns as there are
+                            outcomes, updated in place
+    :param learning_rate:   the product of cue salience and learning rate (alpha * beta)
+    :param lam:             maximum amount of association that an outcome can receive from all the cues
+    :param start:           the index of the first learning event to learn from
+    :param stop:            the index of the learning event to stop at (excluded). Default to None means all events
+                            from start onwards are processed
+    :param use_numba:       a boolean, whether to run the compiled Numba kernel. Default to None means the kernel is used
+                            if Numba is installed
+
+    The weights are updated as in the original trial-by-trial implementation, and in the same order of operations, so
+    the resulting matrix is identical: the activation of each outcome sums the weights of all the cues in the event (a
+    cue occurring twice contributes twice), and the change in association is added once to the row of each distinct cue.
+    The computations happen in the type of weight_matrix, so a float32 matrix halves the memory footprint.
     """
 
-    outcomes = set()
-    cues = set()
-
-    corpus = json.load(open(input_file, 'r+'))
-
-    for i in range(len(corpus[0])):
-        trial_cues = set(corpus[0][i])
-        cues.update(trial_cues)
-        trial_outcomes = set(corpus[1][i])
-        outcomes.update(trial_outcomes)
-
-    cues2ids = {k: idx for idx, k in enumerate(sorted(cues))}
-    outcomes2ids = {k: idx for idx, k in enumerate(sorted(outcomes))}
-
-    return cues2ids, outcomes2ids
-
-def compute_activations(input_file, output_files, alpha, beta, lam, indices):
+    cues, cue_offsets = encoded_corpus['cues'], encoded_corpus['cue_offsets']
+    unique_cues, unique_cue_offsets = encoded_corpus['unique_cues'], encoded_corpus['unique_cue_offsets']
+    outcomes, outcome_offsets = encoded_corpus['outcomes'], encoded_corpus['outcome_offsets']
+
+    stop = len(cue_offsets) - 1 if stop is None else stop
+    learning_rate = weight_matrix.dtype.type(learning_rate)
+    lam = weight_matrix.dtype.type(lam)
+
+    if use_numba is None:
+        use_numba = njit is not None
+    if use_numba:
+        if njit is None:
+            raise ImportError("Numba is not installed: install it or train with use_numba=False.")
+        _numba_updates(cues, cue_offsets, unique_cues, unique_cue_offsets, outcomes, outcome_offsets,
+                       weight_matrix, learning_rate, lam, start, stop)
+        return
+
+    # buffers reused across learning events: the activation (and then change in activation) of each outcome, and the
+    # rows of the weight matrix gathered for the cues in the current event
+    max_cues = int(np.max(np.diff(cue_offsets[start:stop + 1]), initial=0))
+    total_v = np.empty(weight_matrix.shape[1], dtype=weight_matrix.dtype)
+    cue_rows = np.empty((max_cues, weight_matrix.shape[1]), dtype=weight_matrix.dtype)
+
+    for i in range(start, stop):
+        cue_mask = cues[cue_offsets[i]:cue_offsets[i + 1]]
+
+        # compute the total activation for each outcome given the cues in the current learning trial: a row is
+        # considered as many times as its corresponding index occurs in the current trial
+        trial_rows = cue_rows[:len(cue_mask)]
+        np.take(weight_matrix, cue_mask, axis=0, out=trial_rows, mode='clip')
+        np.sum(trial_rows, axis=0, out=total_v)
+
+        # compute the change in activation for each outcome: lambda minus the total activation for the outcomes present
+        # in the learning trial, minus the total activation for all the others
+        np.negative(total_v, out=total_v)
+        total_v[outcomes[outcome_offsets[i]:outcome_offsets[i + 1]]] += lam
+        total_v *= learning_rate
+
+        # sum the vector of changes in association to the row of each distinct cue in the learning trial
+        weight_matrix[unique_cues[unique_cue_offsets[i]:unique_cue_offsets[i + 1]]] += total_v
+
+def compute_activations(input_file, output_files, alpha, beta, lam, indices, dtype=np.float64, use_numba=None,
+                        checkpoint_format='dense', resume=True):
 
     """
     :param input_file:          the path to a a .json file consisting of two lists of lists, the first containing
@@ -59,105 +124,79 @@ def compute_activations(input_file, output_files, alpha, beta, lam, indices):
                                 acts as a scaling factor, so changing its value has the same effects of changing alpha.
     :param indices:             a list of numbers indicating when to store the matrix of associations to file. The
                                 numbers indicate percentages of the input corpus.
+    :param dtype:               the NumPy type of the matrix of associations. Default to float64; float32 halves the
+                                memory footprint and speeds up learning, at the cost of precision
+    :param use_numba:           a boolean, whether to learn using the compiled Numba kernel (see
+                                rescorla_wagner_updates). Default to None means the kernel is used if Numba is installed
+    :param checkpoint_format:   a string indicating how matrices are written to file, see checkpoints.save_checkpoint:
+                                'dense' (default), 'float32', 'sparse' to store a scipy.sparse matrix, or
+                                'sparse_delta' to only store the rows of cues which occurred since the previous matrix
+                                was written
+    :param resume:              a boolean. If True (default), learning resumes from the latest matrix already written
+                                to file before the first one that is missing, instead of from the start of the corpus.
+                                Resuming from a matrix written as float32 continues from its rounded weights
     """
 
-    folder = os.path.dirname(input_file)
-    cue_indices = os.path.join(folder, 'cueIDs.json')
-    outcome_indices = os.path.join(folder, 'outcomeIDs.json')
-
-    if os.path.exists(cue_indices) and os.path.exists(outcome_indices):
-        cues2ids = json.load(open(cue_indices, 'r'))
-        outcomes2ids = json.load(open(outcome_indices, 'r'))
-        #print("length of cues: ", len(cues2ids))
-        #print("length of outcomes: ", len(outcomes2ids))
-    else:
-        # get two dictionaries mapping each cue and each outcome from the input corpus to a unique numerical index
-        cues2ids, outcomes2ids = get_cues_and_outcomes(input_file)
-        #print("length of cues: ", len(cues2ids))
-        #print("length of outcomes: ", len(outcomes2ids))
-        json.dump(cues2ids, open(cue_indices, 'w'))
-        json.dump(outcomes2ids, open(outcome_indices, 'w'))
+    # the corpus is read only once, to compile it into integer arrays of cue and outcome indices stored in .npy files
+    # (see compiled_corpus), which are then memory-mapped: no Python object needs to be looked up or allocated while
+    # the weights are updated, and the corpus is compiled again only if it changed
+    if not is_compiled(input_file):
+        compile_corpus(input_file)
+    encoded_corpus, n_cues, n_outcomes = load_compiled_corpus(compiled_folder(input_file))
 
     print()
     print(strftime("%Y-%m-%d %H:%M:%S") + ": number of cues and outcomes in the input corpus estimated.")
     print()
     
     
-    # create an empty matrix with as many rows as there are cues and as many columns as there are outcomes in
-    # input corpus. The indices extracted before will point to a row for cues and to a column for outcomes
-    weight_matrix = np.zeros((len(cues2ids), len(outcomes2ids)))
-    print("shape of matrix: ", weight_matrix.shape)
-
     # compute the learning rate once and for all, since alpha doesn't change and beta is constant for all cues
     learning_rate = alpha * beta
 
     print(strftime("%Y-%m-%d %H:%M:%S") + ": started estimating the cue-outcome associations.")
 
-    corpus = json.load(open(input_file, 'r+'))
-    # get the total number of learning trials and the line indexes corresponding to each 5% of the corpus to
-    # print the advance in processing the input corpus each time an additional 5% of the learning trials is
-    # processed
-    total_utterances = len(corpus[0])
-    check_points = {int(np.floor(total_utterances / 100 * n)): n for n in indices}
-
-    for i in range(len(corpus[0])):
-        # get the cues and outcomes in the learning trial
-        trial_cues = list(corpus[0][i])
-        trial_outcomes = set(corpus[1][i])
-        #print("trial cues: ", trial_cues)
-        #print("trial outcomes: ", trial_outcomes)
-
-        # Create a masking vector for outcomes: the vector contains 0s for all outcomes that don't occur in the
-        # learning trial and the lambda value for all outcomes that don't.
-        outcome_mask = np.zeros(len(outcomes2ids))
-        for outcome in trial_outcomes:
-            outcome_mask[outcomes2ids[outcome]] = lam
-        #print("outcome_mask: ", outcome_mask)
-
-        # create a masking vector for the cues: this vector contains as many elements as there are cues in the
-        # learning trial. If a cue occurs more than once, its corresponding index will appear more than once
-        cue_mask = []
-        for cue in trial_cues:
-            cue_mask.append(cues2ids[cue])
-        #print("cue_mask: ", cue_mask)
-
-        # compute the total activation for each outcome given the cues in the current learning trial. In order
-        # to select the cues that are present in the learning trial - and only those - the cue masking vector is
-        # used: it subsets the weight matrix using the indices appended to it, and a row is considered as many
-        # times as its corresponding index occurs in the current trial. Then, a sum is performed column-wise
-        # returning the total activation for all outcomes. The total activation for unknown outcomes, those that
-        # are yet to be experienced, will be 0.
-        total_v = np.sum(weight_matrix[cue_mask], axis=0)
-        #print("total activation: ", total_v)
-
-        """
-        exceeding_ids = np.argwhere(total_v > lam)
-        exceeding_lam = total_v[total_v > lam]
-        if total_v[total_v > lam].any():
-            print(strftime("%Y-%m-%d %H:%M:%S") + ": Something went wrong with utterance number %d:" % i)
-            print('outcomes for which activation over cues exceeds lambda: ', exceeding_ids)
-            print('activation for outcomes with activation higher than lambda: ', exceeding_lam)
-            print(trial_cues, trial_outcomes)
-        """
-
-        # compute the change in activation for each outcome using the outcome masking vector (that has a value
-        # of 0 in correspondence of all absent outcomes and a value of lambda in correspondence of all present
-        # outcomes). Given that yet to be experienced outcomes have a total activation of 0 and a lambda value
-        # of 0, no change in association happens for cue-outcome associations involving these outcomes. On the
-        # contrary, known but not present outcomes have a lambda value of 0 (in the outcome mask vector) but a
-        # total activation higher or lower, resulting in a change of association.
-        delta_a = (outcome_mask - total_v) * learning_rate
-
-        # sum the vector of changes in association to the weight matrix: each value in delta_a is summed to all
-        # values in the corresponding column of the weight_matrix indicated by cue_mask
-        weight_matrix[cue_mask] += delta_a
+    # get the total number of learning trials and the line indexes corresponding to each checkpoint, at which the
+    # advance in processing the input corpus is printed and the matrix estimated so far is written to file
+    total_utterances = len(encoded_corpus['cue_offsets']) - 1
+    offsets = {n: int(np.floor(total_utterances / 100 * n)) for n in output_files}
+    check_points = {offsets[n]: n for n in indices}
+
+    # create an empty matrix with as many rows as there are cues and as many columns as there are outcomes in
+    # input corpus. The indices extracted before will point to a row for cues and to a column for outcomes. If a matrix
+    # estimated on part of the corpus already exists, learning continues from there instead
+    start = 0
+    base_path = None
+    resume_index = latest_checkpoint(output_files, offsets, total_utterances, min(check_points)) if resume else None
+    if resume_index is not None:
+        base_path = output_files[resume_index]
+        weight_matrix = load_association_matrix(base_path).astype(dtype)
+        start = offsets[resume_index]
+        print(strftime("%Y-%m-%d %H:%M:%S") + ": resumed from the matrix at %d%% of the input corpus (%s)."
+              % (resume_index, base_path))
+    else:
+        weight_matrix = np.zeros((n_cues, n_outcomes), dtype=dtype)
+    print("shape of matrix: ", weight_matrix.shape)
+
+    # rows of the cues which occurred since the last matrix was written, which are the only ones stored in sparse deltas
+    changed_rows = np.zeros(weight_matrix.shape[0], dtype=bool)
+
+    for stop in sorted(check_points):
+        if stop < start:
+            continue
+        rescorla_wagner_updates(encoded_corpus, weight_matrix, learning_rate, lam, start=start, stop=stop,
+                                use_numba=use_numba)
+        changed_rows[encoded_corpus['unique_cues'][encoded_corpus['unique_cue_offsets'][start]:
+                                                   encoded_corpus['unique_cue_offsets'][stop]]] = True
+        start = stop
 
         # print to console the progress made by the function
-        if i+1 in check_points:
-            print(strftime("%Y-%m-%d %H:%M:%S") + ": %d%% of the input corpus has been processed."
-                  % check_points[i+1])
-
-            if os.path.exists(output_files[check_points[i+1]]):
-                print("The file %s already exists." % output_files[check_points[i+1]])
-            else:
-                np.save(output_files[check_points[i+1]], weight_matrix)
+        if stop == 0:
+            continue
+        print(strftime("%Y-%m-%d %H:%M:%S") + ": %d%% of the input corpus has been processed." % check_points[stop])
+
+        if os.path.exists(output_files[check_points[stop]]):
+            print("The file %s already exists." % output_files[check_points[stop]])
+        else:
+            save_checkpoint(output_files[check_points[stop]], weight_matrix, stop, total_utterances,
+                            checkpoint_format=checkpoint_format, changed_rows=changed_rows, base_path=base_path)
+            base_path = output_files[check_points[stop]]
+            changed_rows[:] = False
@@ -18,11 +18,24 @@ def get_cues_and_outcomes(input_file):
     :return outcome2ids:    a dictionary mapping each of the strings found in the outcomes fields to a numerical index
     """
 
+    corpus = json.load(open(input_file, 'r+'))
+
+    return collect_cues_and_outcomes(corpus)
+
+
+def collect_cues_and_outcomes(corpus):
+
+    """
+    :param corpus:          two lists of lists, the first encoding learning events into their cues and the second
+                            encoding the same learning events into their outcomes, as stored in the files read by
+                            get_cues_and_outcomes
+    :return cue2ids:        a dictionary mapping each cue to a numerical index, following alphabetical order
+    :return outcome2ids:    a dictionary mapping each outcome to a numerical index, following alphabetical order
+    """
+
     outcomes = set()
     cues = set()
 
-    corpus = json.load(open(input_file, 'r+'))
-
     for i in range(len(corpus[0])):
         trial_cues = set(corpus[0][i])
         cues.update(trial_cues)
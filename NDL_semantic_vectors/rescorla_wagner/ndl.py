@@ -4,6 +4,7 @@ import os
 import numpy as np
 from time import strftime
 from rescorla_wagner.compute_activations import compute_activations
+from rescorla_wagner.checkpoints import checkpoint_extension
 
 
 def file_exists(output_files):
@@ -24,7 +25,8 @@ def file_exists(output_files):
 ########################################################################################################################
 
 
-def ndl(input_file, longitudinal=False, alpha=0.01, beta=0.01, lam=1.0):
+def ndl(input_file, longitudinal=False, alpha=0.01, beta=0.01, lam=1.0, dtype=np.float64, use_numba=None,
+        checkpoint_format='dense', resume=True):
 
     """
     :param input_file:          the path to a a .json file consisting of two lists of lists, the first containing
@@ -44,6 +46,14 @@ def ndl(input_file, longitudinal=False, alpha=0.01, beta=0.01, lam=1.0):
                                 acts as a scaling factor, so changing its value has the same effects of changing alpha.
     :param longitudinal:        a boolean specifying whether to adopt a longitudinal design and store association
                                 matrices at every 10%% of the data, to be able to analyze the time course of learning
+    :param dtype:               the NumPy type of the matrix of associations (float64 or float32)
+    :param use_numba:           a boolean, whether to learn using the compiled Numba kernel. Default to None means the
+                                kernel is used if Numba is installed
+    :param checkpoint_format:   a string, how association matrices are written to file: 'dense' (default), 'float32',
+                                'sparse' or 'sparse_delta' (see checkpoints.save_checkpoint). Sparse matrices and deltas
+                                are stored in .npz files and have to be read with checkpoints.load_association_matrix
+    :param resume:              a boolean, whether to resume learning from the latest association matrix already written
+                                to file rather than from the start of the corpus
     :return file_paths:         a dictionary mapping each time index to the file path where the matrix of cue-outcome
                                 associations at that time index is stored
 
@@ -58,7 +68,10 @@ def ndl(input_file, longitudinal=False, alpha=0.01, beta=0.01, lam=1.0):
     contain more cues, it'll take a bit more than a minute, while if the second 1k utterances are shorter and contain
     fewer cues, it'll take slightly less than a minute to process them.
     In details, it takes ~14 minutes to process ~550k utterances using the configuration with triphones only to encode
-    input utterances, using a 2x Intel Xeon 6-Core E5-2603v3 with 2x6 cores and 2x128 Gb of RAM.
+    input utterances, using a 2x Intel Xeon 6-Core E5-2603v3 with 2x6 cores and 2x128 Gb of RAM. These figures refer to
+    the original trial-by-trial implementation: the corpus is now encoded as integer arrays before learning starts and,
+    if Numba is installed, the weights are updated by a compiled kernel, which is several times faster and produces the
+    same matrix.
     """
 
     # create file paths for every required time point
@@ -67,7 +80,8 @@ def ndl(input_file, longitudinal=False, alpha=0.01, beta=0.01, lam=1.0):
 
     indices = np.linspace(10, 100, 10) if longitudinal else [100]
     for idx in indices:
-        output_files[idx] = os.path.join(folder, '.'.join(['_'.join(['associationMatrix', str(int(idx))]), 'npy']))
+        output_files[idx] = os.path.join(folder, '.'.join(['_'.join(['associationMatrix', str(int(idx))]),
+                                                           checkpoint_extension(checkpoint_format)]))
 
     missing_indices = []
     for idx, f_path in output_files.items():
@@ -83,7 +97,8 @@ def ndl(input_file, longitudinal=False, alpha=0.01, beta=0.01, lam=1.0):
         # this function writes the matrix of association to file for every time index specified in missing_indices
         # it also writes to json files the dictionary mapping cues to their row indices in the association matrices,
         # and the dictionary mapping outcomes to their column indices in the association matrices
-        compute_activations(input_file, output_files, alpha, beta, lam, missing_indices)
+        compute_activations(input_file, output_files, alpha, beta, lam, missing_indices, dtype=dtype,
+                            use_numba=use_numba, checkpoint_format=checkpoint_format, resume=resume)
 
         print(strftime("%Y-%m-%d %H:%M:%S") + ": ... I finished estimating the cue-outcome associations.")   
 
@@ -0,0 +1,92 @@
+"""Functions to estimate cue-outcome associations for many combinations of learning parameters at once"""
+
+import os
+import itertools
+import numpy as np
+import multiprocessing as mp
+from time import strftime
+from rescorla_wagner.compiled_corpus import compile_corpus, load_compiled_corpus, is_compiled, compiled_folder
+from rescorla_wagner.compute_activations import rescorla_wagner_updates
+
+
+def parameter_key(alpha, beta, lam):
+
+    """
+    :param alpha:   cue salience
+    :param beta:    learning rate
+    :param lam:     maximum amount of association that an outcome can receive from all the cues
+    :return:        a string identifying the combination of parameters, used to name the files matrices are stored in
+    """
+
+    return '_'.join(['alpha' + repr(float(alpha)), 'beta' + repr(float(beta)), 'lambda' + repr(float(lam))])
+
+
+def parameter_grid(alphas, betas, lams):
+
+    """
+    :param alphas:  an iterable of cue salience values
+    :param betas:   an iterable of learning rate values
+    :param lams:    an iterable of lambda values
+    :return:        a list of (alpha, beta, lambda) tuples, one for every combination of the input values
+    """
+
+    return list(itertools.product(alphas, betas, lams))
+
+
+def _train_configuration(args):
+
+    corpus_folder, alpha, beta, lam, output_file, dtype, use_numba = args
+
+    # every worker memory-maps the same read-only arrays, which the operating system keeps in memory only once
+    encoded_corpus, n_cues, n_outcomes = load_compiled_corpus(corpus_folder)
+    weight_matrix = np.zeros((n_cues, n_outcomes), dtype=dtype)
+    rescorla_wagner_updates(encoded_corpus, weight_matrix, alpha * beta, lam, use_numba=use_numba)
+    np.save(output_file, weight_matrix)
+
+    return (alpha, beta, lam), output_file
+
+
+def ndl_sweep(input_file, configurations, threads=4, dtype=np.float64, use_numba=None):
+
+    """
+    :param input_file:      the path to a a .json corpus, see compute_activations.compute_activations
+    :param configurations:  an iterable of (alpha, beta, lambda) tuples, e.g. as returned by parameter_grid
+    :param threads:         the number of configurations to train at the same time, each in its own process
+    :param dtype:           the NumPy type of the matrices of associations
+    :param use_numba:       a boolean, whether to learn using the compiled Numba kernel. Default to None means the
+                            kernel is used if Numba is installed
+    :return file_paths:     a dictionary mapping each (alpha, beta, lambda) tuple to the path of the file where the matrix
+                            of cue-outcome associations estimated on the whole corpus with those parameters is stored
+
+    The corpus is compiled once (see compiled_corpus) and shared read-only by all the processes, so every configuration
+    costs one pass over the events and one matrix in memory. Matrices are stored next to the corpus in files named after
+    their parameters (see parameter_key): those which already exist are not estimated again.
+    """
+
+    if not is_compiled(input_file):
+        compile_corpus(input_file)
+    corpus_folder = compiled_folder(input_file)
+
+    folder = os.path.dirname(input_file)
+    file_paths = {}
+    jobs = []
+    for alpha, beta, lam in configurations:
+        output_file = os.path.join(folder, '.'.join(['_'.join(['associationMatrix', parameter_key(alpha, beta, lam)]),
+                                                     'npy']))
+        file_paths[(alpha, beta, lam)] = output_file
+        if os.path.exists(output_file):
+            print(strftime("%Y-%m-%d %H:%M:%S") + ": The matrix of weights already exists at file %s." % output_file)
+        else:
+            jobs.append((corpus_folder, alpha, beta, lam, output_file, dtype, use_numba))
+
+    print(strftime("%Y-%m-%d %H:%M:%S") + ": I started estimating the cue-outcome associations for %d configurations..."
+          % len(jobs))
+
+    with mp.Pool(min(threads, max(len(jobs), 1))) as pool:
+        for n, (parameters, output_file) in enumerate(pool.imap_unordered(_train_configuration, jobs)):
+            print(strftime("%Y-%m-%d %H:%M:%S") + ": %d of %d configurations done (alpha=%s, beta=%s, lambda=%s)."
+                  % ((n + 1, len(jobs)) + parameters))
+
+    print(strftime("%Y-%m-%d %H:%M:%S") + ": ... I finished estimating the cue-outcome associations.")
+
+    return file_paths
@@ -15,6 +15,10 @@ relation_node = './/{%s}s' % NS
 inflection_node = './/{%s}mor/{%s}mw/{%s}mk' % (NS, NS, NS)
 clitic_node = './/{%s}mor/{%s}mor-post/{%s}mw/{%s}stem' % (NS, NS, NS, NS)
 clitic_pos_tag_node = './/{%s}mor/{%s}mor-post/{%s}gra' % (NS, NS, NS)
+# tags of the elements the single-pass extractor reacts to while the document is being parsed
+participants_tag = '{%s}Participants' % NS
+participant_tag = '{%s}participant' % NS
+sent_tag = '{%s}u' % NS
 
 def add_inflection(xmlword, word):
     xmlinfl = xmlword.find(inflection_node)
@@ -127,4 +131,111 @@ class ModifiedCHILDESCorpusReader(CHILDESCorpusReader):
                 else:
                     results.extend(sents)
 
-        return results
\ No newline at end of file
+        return results
+
+    def transcript(self, fileid, strip_space=True, replace=True):
+
+        """
+        Single-pass alternative to calling participants, age, sents and tagged_sents on the same file, each of which
+        parses it again. The document is parsed incrementally with iterparse, and every utterance is discarded as soon
+        as its words have been extracted, so memory does not grow with the length of the transcript.
+
+        :param fileid:          the file to read, relative to the root of the corpus reader
+        :param strip_space:     strip the surrounding spaces of tokens, as in sents
+        :param replace:         use the replacement words of the utterance, as in sents
+        :return participants:   dict mapping the id of each participant to a dict with its attributes (name, role,
+                                age, ...), read from the header of the document
+        :return utterances:     generator yielding, for each utterance in the document, a tuple with the id of the
+                                speaker, its role (None if the speaker is not listed among the participants or has no
+                                role), the list of tokens as returned by sents(stem=False) and the list of (stem, POS
+                                tag) tuples, stems including their inflection and clitics given as separate items, as
+                                returned by tagged_sents(stem=True)
+        """
+
+        fp = open(self.abspath(fileid), 'rb')
+        events = ElementTree.iterparse(fp, events=('start', 'end'))
+        _, root = next(events)
+
+        # the participants are listed in the header, which is read before any utterance
+        participants = {}
+        for event, elem in events:
+            if event == 'end' and elem.tag == participant_tag:
+                participants[elem.get('id')] = dict(elem.items())
+            elif (event == 'end' and elem.tag == participants_tag) or (event == 'start' and elem.tag == sent_tag):
+                break
+
+        def utterances():
+            try:
+                for event, elem in events:
+                    if event != 'end' or elem.tag != sent_tag:
+                        continue
+                    speaker = elem.get('who')
+                    role = participants.get(speaker, {}).get('role')
+                    tokens, stems = self._get_words_and_stems(elem, strip_space, replace)
+                    # the utterance has been fully processed: drop it (and anything read before it) from the tree
+                    root.clear()
+                    yield speaker, role, tokens, stems
+            finally:
+                fp.close()
+
+        return participants, utterances()
+
+    @staticmethod
+    def _get_words_and_stems(xmlsent, strip_space, replace):
+
+        # the tokens and the tagged stems of a sentence, extracted as _get_words does with stem=False and stem=True
+        tokens = []
+        stems = []
+        for xml_word in xmlsent.findall(word_node):
+
+            # get replaced words
+            if replace:
+                xml_word = get_replaced_word(xmlsent, xml_word)
+
+            # get text
+            if xml_word.text:
+                word = xml_word.text
+            else:
+                word = ''
+
+            # strip tailing space
+            if strip_space:
+                word = word.strip()
+            tokens.append(word)
+
+            # get stemmed words
+            stem = word
+            try:
+                xmlstem = xml_word.find(stem_node)
+                stem = xmlstem.text
+            except AttributeError:
+                pass
+
+            # if there is an inflection
+            try:
+                stem = add_inflection(xml_word, stem)
+            except:
+                pass
+
+            # if there is a clitic
+            try:
+                xmlclitic = xml_word.find(clitic_node)
+                clitic_stem = xmlclitic.text
+            except AttributeError:
+                clitic_stem = ''
+
+            # get pos
+            try:
+                stems.append((stem, get_pos_tag(xml_word)))
+            except (AttributeError, IndexError):
+                stems.append((stem, None))
+
+            if clitic_stem:
+                # add clitic's pos tag if there is one
+                clitic_pos = xml_word.find(clitic_pos_tag_node)
+                if clitic_pos is not None:
+                    stems.append((clitic_stem, clitic_pos.get('relation')))
+                else:
+                    stems.append((clitic_stem, None))
+
+        return tokens, stems
\ No newline at end of file
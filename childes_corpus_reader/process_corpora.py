@@ -1,6 +1,11 @@
 import glob
 import os
 import json
+import time
+import shutil
+import hashlib
+from bisect import bisect_right
+import multiprocessing as mp
 from CorpusReader import ModifiedCHILDESCorpusReader
 
 
@@ -86,41 +91,34 @@ def get_tokens_lexemes_from_corpus(corpus, root_folder):
     token_counter = 0    #token counter to check how many tokens are in one particular corpus (use if needed for checking)
     
     corpus_reader = ModifiedCHILDESCorpusReader(str(root_folder), corpus) # specify the root folder here
-    corpus_participants = corpus_reader.participants(corpus_reader.fileids())
 
-    childlist = set()    #list of all participant keys from target children
-    adultlist = set()    #list of all participant keys from non-target children
-        
-    age = corpus_reader.age(month=True)
+    # the file is parsed only once: the participants are read from its header, then the utterances are extracted one
+    # at a time, each with its speaker's role, its tokens and its stems
+    participants, utterances = corpus_reader.transcript(corpus, strip_space=True, replace=True)
+
+    # the age of the target child in months, None if it is missing or malformed (as returned by corpus_reader.age)
+    try:
+        age = [corpus_reader.convert_age(participants['CHI']['age'])]
+    except (KeyError, TypeError, AttributeError, ValueError):
+        age = [None]
     
     # checks if the age of the children is specified (sometimes this is not the case), if not, the file cannot be used
-    # then adds target children keys to the childlist and the rest to the adultlist
+    # then splits the sentences of target children from the sentences of the other participants (with a role)
     if age:
-        for this_corpus_participants in corpus_participants:
-            for key in sorted(this_corpus_participants.keys()):
-                dct = this_corpus_participants[key]
-                for k in sorted(dct.keys()):
-                    if k == 'role' and dct[k] == 'Target_Child':
-                        childlist.add(key)
-                    elif k == 'role' and dct[k] != 'Target_Child':
-                        adultlist.add(key)
-
         # we need the corpus both in stemmed format and in token format
-        # stem=True return a list of stem sentences; each stem is given in a tuple with its POS tag, e.g. (car, 'n')
-        stem_sents = corpus_reader.tagged_sents(corpus, adultlist, stem=True, relation=False,
-                                                strip_space=True, replace=True)
-        child_stems = corpus_reader.tagged_sents(corpus, childlist, stem=True, relation=False,
-                                                 strip_space=True, replace=True)
-        
-        # stem=False returns a list of token sentences; tokens are given as plain strings (without POS tags)
-        token_sents = corpus_reader.sents(corpus, adultlist, stem=False, relation=False,
-                                          strip_space=True, replace=True)        
-        child_tokens = corpus_reader.sents(corpus, childlist, stem=False, relation=False,
-                                          strip_space=True, replace=True)
+        # stems are given in a tuple with their POS tag, e.g. (car, 'n'); tokens are given as plain strings
+        stem_sents, token_sents = [], []
+        child_stems, child_tokens = [], []
+        for speaker, role, tokens, stems in utterances:
+            if role == 'Target_Child':
+                child_stems.append(stems)
+                child_tokens.append(tokens)
+            elif role is not None:
+                stem_sents.append(stems)
+                token_sents.append(tokens)
 
         # give a name to the current corpus (is for checking which corpus is done being processed during code execution)
-        participant_dict = corpus_reader.participants(corpus)[0]['CHI']
-        name = participant_dict['name']
+        name = participants.get('CHI', {}).get('name', '')
         if len(name) == 0:
             name = str(corpus)
 
@@ -176,13 +174,70 @@ def get_tokens_lexemes_from_corpus(corpus, root_folder):
         corpora.append(str(corpus))
         child_names.append(name)
 
-    print('Processed corpus %s (%s tokens).' % (str(corpus), token_counter)) # prints to check how far in the executing we are
     return token_transcripts, lexeme_transcripts, child_token_transcripts, child_lexeme_transcripts, ages, corpora, child_names
 
-def get_tokens_lexemes(root_folder, corpora):
+def _mp_tokens_lexemes(args):
+
+    # extracts a single transcript in a worker process, timing the extraction
+    corpus, root_folder = args
+    start = time.time()
+    extracted = get_tokens_lexemes_from_corpus(corpus, root_folder)
+
+    return extracted, time.time() - start
+
+def iter_tokens_lexemes(root_folder, corpora, processes=1, chunksize=4):
 
     """
     param corpora: list of corpus names to be considered (directories in the root folder)
+    param processes: number of worker processes the transcripts are spread over. Default to 1 extracts them one after
+        the other in the current process
+    param chunksize: number of transcripts sent to a worker at once
+    generator yielding, for each corpus in the order of corpora (whatever the number of processes, so the output is
+    always the same), the lists returned by get_tokens_lexemes_from_corpus
+    """
+    
+    n_transcripts = 0
+    n_tokens = 0
+    start = time.time()
+
+    tasks = [(corpus, root_folder) for corpus in corpora]
+    if processes > 1 and len(tasks) > 1:
+        pool = mp.Pool(processes)
+        # imap yields the results in the order of the transcripts, whichever worker finishes first
+        extracted = pool.imap(_mp_tokens_lexemes, tasks, chunksize=chunksize)
+    else:
+        pool = None
+        extracted = map(_mp_tokens_lexemes, tasks)
+
+    try:
+        for corpus, (result, seconds) in zip(corpora, extracted):
+            token_transcripts, child_token_transcripts = result[0], result[2]
+            corpus_tokens = sum(len(sent) for transcript in token_transcripts + child_token_transcripts for sent in transcript)
+            n_tokens += corpus_tokens
+            # prints to check how far in the executing we are
+            print('Processed corpus %s (%s tokens in %.2f s, %.0f tokens/s).' %
+                  (str(corpus), corpus_tokens, seconds, corpus_tokens / max(seconds, 1e-6)))
+            if len(token_transcripts) == 0:
+                print('Corpus is not marked for age and / or child name: %s' % corpus)
+            n_transcripts += len(token_transcripts)
+
+            yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    elapsed = time.time() - start
+    print('Done processing corpus/corpora (%s files in %.1f s, %.2f files/s, %.0f tokens/s)' %
+          (len(corpora), elapsed, len(corpora) / max(elapsed, 1e-6), n_tokens / max(elapsed, 1e-6)))
+    print('Nr transcripts: %s' % n_transcripts)
+
+def get_tokens_lexemes(root_folder, corpora, processes=1, chunksize=4):
+
+    """
+    param corpora: list of corpus names to be considered (directories in the root folder)
+    param processes: number of worker processes the transcripts are spread over (see iter_tokens_lexemes)
+    param chunksize: number of transcripts sent to a worker at once
     this function returns multiple lists for all corpora: 
         a list of tokens uttered by anyone but the target child
         a list of corresponding lexemes and PoS tags of the above mentioned tokens
@@ -192,8 +247,6 @@ def get_tokens_lexemes(root_folder, corpora):
         a list with the name of the corpora that where processed (in this case only one, but the function could be modified to consider more corpora at once)
         a list of all the child names in the corpus
     """
-    
-    n_transcripts = 0
 
     ret = {'token_transcripts': [],
            'lexeme_transcripts': [],
@@ -203,10 +256,8 @@ def get_tokens_lexemes(root_folder, corpora):
            'child_ages': [],
            'child_names': []}
 
-    for corpus in corpora:
-        print(corpus)
-        token_transcripts, lexeme_transcripts, child_token_transcripts, child_lexeme_transcripts, ages, corpus_names, child_names = \
-            get_tokens_lexemes_from_corpus(corpus, root_folder)
+    for result in iter_tokens_lexemes(root_folder, corpora, processes=processes, chunksize=chunksize):
+        token_transcripts, lexeme_transcripts, child_token_transcripts, child_lexeme_transcripts, ages, corpus_names, child_names = result
         ret['token_transcripts'] += token_transcripts
         ret['lexeme_transcripts'] += lexeme_transcripts
         ret['child_token_transcripts'] += child_token_transcripts
@@ -215,195 +266,349 @@ def get_tokens_lexemes(root_folder, corpora):
         ret['corpus_names'] += corpus_names
         ret['child_names'] += child_names
 
-        if len(token_transcripts) == 0:
-            print('Corpus is not marked for age and / or child name: %s' % corpus)
-            continue
+    return ret
+
+def transcript_records(result):
 
-        n_transcripts += len(token_transcripts)
+    """
+    turns the lists returned by get_tokens_lexemes_from_corpus into one record (a dict) per transcript, as stored in the
+    .jsonl file of the raw corpus: the name of the corpus, the name and age (in months, None if unknown) of the child
+    and the four lists of sentences of the transcript
+    """
 
-    print('Done processing corpus/corpora')
-    print('Nr transcripts: %s' % n_transcripts, len(ret['token_transcripts']))
+    for tokens, lexemes, child_tokens, child_lexemes, ages, corpus_name, child_name in zip(*result):
+        yield {'corpus_name': corpus_name,
+               'child_name': child_name,
+               'child_age': ages[0] if ages else None,
+               'token_transcript': tokens,
+               'lexeme_transcript': lexemes,
+               'child_token_transcript': child_tokens,
+               'child_lexeme_transcript': child_lexemes}
 
-    return ret
+def raw_corpus_path(file_dir, corpus):
+
+    """
+    returns the path of the JSON Lines file storing the raw corpus, one transcript per line
+    """
 
-def process_and_save_corpus_data(filelist2, file_dir, root_folder):
+    return file_dir + '/%s_raw.jsonl' % corpus
+
+def process_and_save_corpus_data(filelist2, file_dir, root_folder, processes=1, corpus='corpus_EN_child'):
 
     """
-    pre-process corpora and pickle result to file directory
+    pre-process corpora and save the result to file directory, as a JSON Lines file with one record per transcript
+    (see transcript_records), which is written as the transcripts are extracted, so the corpus is never held in memory
+    param processes: number of worker processes the transcripts are spread over (see iter_tokens_lexemes)
     """
 
     corpora = filelist2   # the filelist that was created before, containing all .xml files
 
-    corpus_dict = get_tokens_lexemes(root_folder, corpora=corpora)
-    json.dump(corpus_dict, open(file_dir + '/corpus_EN_child_raw.json', 'w'))
+    with open(raw_corpus_path(file_dir, corpus), 'w') as f:
+        for result in iter_tokens_lexemes(root_folder, corpora=corpora, processes=processes):
+            for record in transcript_records(result):
+                f.write(json.dumps(record) + '\n')
+
+def convert_raw_corpus(file_dir, corpus):
 
-def save_corpus_child_directed(file_dir, age_list, corpus):
-    
     """
-    This is a function to extract 2 lists from the .json file which was generated with process_and_save_corpus_data()
-    The first list is a list of all tokens directed at target children, the second list their corresponding lexemes
-    These lists are dumped in .json files, according to the age of the target child
-    This function can be modified to dump different parts of the .json file which was generated with process_and_save_corpus_data()
-    and also on which basis they need to be in different files (or all in the same file)
+    converts a raw corpus saved as a single .json file by earlier versions of process_and_save_corpus_data() into the
+    JSON Lines format, keeping the order of the transcripts
+    """
+
+    cor = json.load(open(file_dir + '/%s_raw.json' % corpus, 'r'))
+    result = (cor['token_transcripts'], cor['lexeme_transcripts'], cor['child_token_transcripts'],
+              cor['child_lexeme_transcripts'], cor['child_ages'], cor['corpus_names'], cor['child_names'])
+    with open(raw_corpus_path(file_dir, corpus), 'w') as f:
+        for record in transcript_records(result):
+            f.write(json.dumps(record) + '\n')
+
+def manifest_path(file_dir, corpus):
+
+    """
+    returns the path of the .json file listing the transcripts already extracted into the raw corpus (see
+    ingest_corpus_data)
+    """
+
+    return file_dir + '/%s_manifest.json' % corpus
+
+def file_hash(path):
+
+    """
+    returns the SHA-1 hash of the content of a file, read in blocks
+    """
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+def save_manifest(file_dir, corpus, manifest):
+
+    # written to a temporary file first, so that an interruption never leaves a truncated manifest behind
+    path = manifest_path(file_dir, corpus)
+    json.dump(manifest, open(path + '.tmp', 'w'))
+    os.replace(path + '.tmp', path)
+
+def filter_raw_corpus(path, keep):
+
+    """
+    rewrites a raw corpus stored in the JSON Lines format, streaming it, with only the records for which keep(record)
+    is True
+    """
+
+    with open(path, 'r') as f, open(path + '.tmp', 'w') as out:
+        for line in f:
+            if keep(json.loads(line)):
+                out.write(line)
+    os.replace(path + '.tmp', path)
+
+def sort_raw_corpus(path, corpora):
+
+    """
+    rewrites a raw corpus stored in the JSON Lines format with its records in the order of corpora (the records of a
+    corpus keep their relative order), as a single extraction of corpora would have written them. Only the position of
+    each line is kept in memory
+    """
+
+    offsets = {}
+    with open(path, 'rb') as f:
+        offset = f.tell()
+        for line in iter(f.readline, b''):
+            offsets.setdefault(json.loads(line)['corpus_name'], []).append(offset)
+            offset = f.tell()
+
+    with open(path, 'rb') as f, open(path + '.tmp', 'wb') as out:
+        for corpus in corpora:
+            for offset in offsets.get(str(corpus), []):
+                f.seek(offset)
+                out.write(f.readline())
+    os.replace(path + '.tmp', path)
+
+def ingest_corpus_data(filelist2, file_dir, root_folder, processes=1, corpus='corpus_EN_child', checkpoint_every=100):
+
+    """
+    incremental version of process_and_save_corpus_data(): only the transcripts which are new, or which changed since
+    they were extracted, are processed and merged into the raw corpus already stored in file directory
+    a manifest records, for every transcript extracted so far, the size, modification time and hash of its file. A file
+    whose size and modification time are unchanged is skipped; a file whose modification time changed but whose content
+    did not (e.g. after being copied) is skipped as well. The records of changed files, and of files which are no
+    longer in filelist2, are removed from the raw corpus
+    the manifest is saved every checkpoint_every transcripts, after their records have been written, so an interrupted
+    run resumes after the last checkpoint: the records of the transcripts extracted after it are removed and redone
+    at the end, the records are put in the order of filelist2, so the raw corpus is the same as the one a full
+    extraction would give
+    param processes: number of worker processes the transcripts are spread over (see iter_tokens_lexemes)
+    """
+
+    corpora = filelist2   # the filelist that was created before, containing all .xml files
+    raw_path = raw_corpus_path(file_dir, corpus)
+    manifest = {}
+    if os.path.exists(manifest_path(file_dir, corpus)) and os.path.exists(raw_path):
+        manifest = json.load(open(manifest_path(file_dir, corpus), 'r'))
+
+    # find the transcripts which are new or changed since they were extracted
+    to_process = []
+    signatures = {}
+    for fileid in corpora:
+        stat = os.stat(os.path.join(root_folder, fileid))
+        signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        known = manifest.get(str(fileid))
+        if known and known['size'] == signature['size'] and known['mtime_ns'] == signature['mtime_ns']:
+            continue
+        signature['sha1'] = file_hash(os.path.join(root_folder, fileid))
+        if known and known['sha1'] == signature['sha1']:
+            manifest[str(fileid)] = signature
+            continue
+        to_process.append(fileid)
+        signatures[str(fileid)] = signature
+
+    removed = set(manifest) - set(str(fileid) for fileid in corpora)
+    print('%s new or changed transcripts to process, %s up to date, %s removed' %
+          (len(to_process), len(corpora) - len(to_process), len(removed)))
+
+    # drop the records of changed and removed transcripts, and of transcripts whose extraction was interrupted
+    stale = removed | set(signatures)
+    for fileid in removed:
+        del manifest[fileid]
+    if os.path.exists(raw_path) and stale:
+        filter_raw_corpus(raw_path, lambda record: record['corpus_name'] not in stale)
+    for fileid in signatures:
+        manifest.pop(fileid, None)
+    save_manifest(file_dir, corpus, manifest)
+
+    with open(raw_path, 'a') as f:
+        pending = []
+        for n, (fileid, result) in enumerate(zip(to_process, iter_tokens_lexemes(root_folder, corpora=to_process,
+                                                                                   processes=processes))):
+            for record in transcript_records(result):
+                f.write(json.dumps(record) + '\n')
+            pending.append(str(fileid))
+            if len(pending) == checkpoint_every or n == len(to_process) - 1:
+                # the records must be on disk before the manifest lists their transcripts as extracted
+                f.flush()
+                os.fsync(f.fileno())
+                for name in pending:
+                    manifest[name] = signatures[name]
+                save_manifest(file_dir, corpus, manifest)
+                pending = []
+
+    if to_process or removed:
+        sort_raw_corpus(raw_path, corpora)
+    print('Raw corpus %s is up to date' % raw_path)
+
+def iter_transcript_records(path, min_age=None, max_age=None, corpus_names=None, child_names=None):
+
+    """
+    generator over the records of a raw corpus stored in the JSON Lines format, read one line at a time
+    param min_age, max_age: only transcripts recorded at an age (in months) of at least min_age and below max_age are
+        returned; transcripts without age are left out as soon as one of them is given
+    param corpus_names, child_names: collections of names; if given, only the transcripts of these corpora / children
+        are returned
+    """
+
+    with open(path, 'r') as f:
+        for line in f:
+            record = json.loads(line)
+            age = record['child_age']
+            if (min_age is not None or max_age is not None) and not isinstance(age, int):
+                continue
+            if (min_age is not None and age < min_age) or (max_age is not None and age >= max_age):
+                continue
+            if corpus_names is not None and record['corpus_name'] not in corpus_names:
+                continue
+            if child_names is not None and record['child_name'] not in child_names:
+                continue
+            yield record
+
+def iter_utterances(path, speaker='adults', min_age=None, max_age=None):
+
+    """
+    generator over the utterances of a raw corpus stored in the JSON Lines format, yielding tuples of the tokens of an
+    utterance and their corresponding lexemes
+    param speaker: 'adults' for the utterances directed at the target child(ren), 'child' for the ones they produced
+    param min_age, max_age: see iter_transcript_records
+    """
+
+    if speaker not in ('adults', 'child'):
+        raise ValueError("The speaker should be either 'adults' or 'child'!")
+    prefix = 'child_' if speaker == 'child' else ''
+
+    for record in iter_transcript_records(path, min_age=min_age, max_age=max_age):
+        for utterance in zip(record[prefix + 'token_transcript'], record[prefix + 'lexeme_transcript']):
+            yield utterance
+
+def iter_raw_transcripts(file_dir, corpus):
+
+    """
+    generator over the transcripts of the raw corpus generated with process_and_save_corpus_data(), read one at a time
+    from its .jsonl file (or, for corpora saved by earlier versions, from the single .json file, which is read whole)
+    yields, for each transcript, a tuple with the ages of the target child(ren), the tokens directed at them, the
+    corresponding lexemes, the tokens they produced and the corresponding lexemes
+    """
+
+    if not os.path.exists(raw_corpus_path(file_dir, corpus)):
+        cor = json.load(open(file_dir + '/%s_raw.json' % corpus, 'r'))
+        for transcript in zip(cor['child_ages'], cor['token_transcripts'], cor['lexeme_transcripts'],
+                              cor['child_token_transcripts'], cor['child_lexeme_transcripts']):
+            yield transcript
+        return
+
+    for record in iter_transcript_records(raw_corpus_path(file_dir, corpus)):
+        yield ([record['child_age']], record['token_transcript'], record['lexeme_transcript'],
+               record['child_token_transcript'], record['child_lexeme_transcript'])
+
+def age_bin_paths(file_dir, age_list, prefix):
+
+    """
+    returns the paths of the files each age bin is dumped into, in the order of age_bin_index
+    if age_list has a single element the corpus is not split and everything goes into one file, otherwise there is one
+    file for each age in age_list (with the transcripts recorded before that age, and after the previous one) and a
+    last file with the transcripts recorded at or after the last age
     """
-    
-    # opens the previous .json file and zips the necessary parts of it in zipped
-    corpus_dir = file_dir + '/%s_raw.json' % corpus
-    cor = json.load(open(corpus_dir, 'r'))
-    zipped = list(zip(cor['child_ages'], cor['token_transcripts'], cor['lexeme_transcripts']))
 
-    #if the length of the age_list is 1, the corpus does not need to be split, so everything can be dumped into 1 single file
     if len(age_list) == 1:
-        print("starting to dump split")
-        tokens = []
-        lexemes = []
-        for a, t, l in zipped:
-            if isinstance(a[0], int):
-                token_transcripts = [t]
-                lexeme_transcripts = [l]
-                for t, l in zip(token_transcripts, lexeme_transcripts):
-                    tokens.extend(t)  # this is now a list of utterances
-                    lexemes.extend(l) # this is now a list of corresponding lexemes to each utterance
-        save = file_dir + '/ChildDirected.json'
-        json.dump((tokens, lexemes), open(save, 'w'))
-
-    #if the length of the age_list is larger than one, then split the corpus according to age, which these loops do
-    elif len(age_list) > 1:
-        for i in range(len(age_list)):
-            print("for child directed speech, starting to dump split: ", str(age_list[i]))
-            if i == 0:
-                tokens = []
-                lexemes = []
-                for a, t, l in zipped:
-                    if isinstance(a[0], int):
-                        if a[0] < int(age_list[i]):
-                            token_transcripts = [t]
-                            lexeme_transcripts = [l]
-                            for t, l in zip(token_transcripts, lexeme_transcripts):
-                                tokens.extend(t)  # this is now a list of utterances
-                                lexemes.extend(l) # this is now a list of corresponding lexemes to each utterance
-                save = file_dir + '/ChildDirected' + str(age_list[i]) + '.json'
-                json.dump((tokens, lexemes), open(save, 'w'))
-            elif i > 0 and i < (len(age_list)-1):
-                tokens = []
-                lexemes = []
-                for a, t, l in zipped:
-                    if isinstance(a[0], int):
-                        if a[0] >= int(age_list[i-1]) and a[0] < int(age_list[i]):
-                            token_transcripts = [t]
-                            lexeme_transcripts = [l]
-                            for t, l in zip(token_transcripts, lexeme_transcripts):
-                                tokens.extend(t)  # this is now a list of utterances
-                                lexemes.extend(l) # this is now a list of corresponding lexemes to each utterance
-                save = file_dir + '/ChildDirected' + str(age_list[i]) + '.json'
-                json.dump((tokens, lexemes), open(save, 'w'))
-            elif i == (len(age_list)-1):
-                tokensMinus = []
-                lexemesMinus = []
-                tokensPlus = []
-                lexemesPlus = []
-                for a, t, l in zipped:
-                    if isinstance(a[0], int):
-                        if a[0] >= int(age_list[i-1]) and a[0] < int(age_list[i]):
-                            token_transcripts = [t]
-                            lexeme_transcripts = [l]
-                            for t, l in zip(token_transcripts, lexeme_transcripts):
-                                tokensMinus.extend(t)  # this is now a list of utterances
-                                lexemesMinus.extend(l) # this is now a list of corresponding lexemes to each utterance
-                        if a[0] >= int(age_list[i]):
-                            token_transcripts = [t]
-                            lexeme_transcripts = [l]
-                            for t, l in zip(token_transcripts, lexeme_transcripts):
-                                tokensPlus.extend(t)  # this is now a list of utterances
-                                lexemesPlus.extend(l) # this is now a list of corresponding lexemes to each utterance
-                saveMinus = file_dir + '/ChildDirected' + str(age_list[i]) + '.json'
-                json.dump((tokensMinus, lexemesMinus), open(saveMinus, 'w'))
-                savePlus = file_dir + '/ChildDirected' + str(age_list[i]) + 'Plus.json'
-                json.dump((tokensPlus, lexemesPlus), open(savePlus, 'w'))
-    
-    print("done dumping corpora")
+        return [file_dir + '/' + prefix + '.json']
+
+    return [file_dir + '/' + prefix + str(age) + '.json' for age in age_list] + \
+           [file_dir + '/' + prefix + str(age_list[-1]) + 'Plus.json']
+
+def age_bin_index(age, age_list):
 
-def save_corpus_child_produced(file_dir, age_list, corpus):
-    
     """
-    This is a function to extract 2 lists from the .json file which was generated with process_and_save_corpus_data()
-    The first list is a list of all tokens produced by target children, the second list their corresponding lexemes
-    These lists are dumped in .json files, according to the age of the target child
+    returns the index of the age bin (see age_bin_paths) a transcript recorded at the given age (in months) belongs to
     """
-    
-    # opens the previous .json file and zips the necessary parts of it in zipped
-    corpus_dir = file_dir + '/%s_raw.json' % corpus
-    cor = json.load(open(corpus_dir, 'r'))
-    zipped = list(zip(cor['child_ages'], cor['child_token_transcripts'], cor['child_lexeme_transcripts']))
-    
-    #if the length of the age_list is 1, the corpus does not need to be split, so everything can be dumped into 1 single file
+
     if len(age_list) == 1:
-        print("starting to dump corpus")
-        tokens = []
-        lexemes = []
-        for a, t, l in zipped:
-            if isinstance(a[0], int):
-                token_transcripts = [t]
-                lexeme_transcripts = [l]
-                for t, l in zip(token_transcripts, lexeme_transcripts):
-                    tokens.extend(t)  # this is now a list of utterances
-                    lexemes.extend(l) # this is now a list of corresponding lexemes to each utterance
-        save = file_dir + '/ChildProduced.json'
-        json.dump((tokens, lexemes), open(save, 'w'))
-
-    #if the length of the age_list is larger than one, then split the corpus according to age, which these loops do
-    elif len(age_list) > 1:
-        for i in range(len(age_list)):
-            print("for child produced speech, starting to dump split: ", str(age_list[i]))
-            if i == 0:
-                tokens = []
-                lexemes = []
-                for a, t, l in zipped:
-                    if isinstance(a[0], int):
-                        if a[0] < int(age_list[i]):
-                            token_transcripts = [t]
-                            lexeme_transcripts = [l]
-                            for t, l in zip(token_transcripts, lexeme_transcripts):
-                                tokens.extend(t)  # this is now a list of utterances
-                                lexemes.extend(l) # this is now a list of corresponding lexemes to each utterance
-                save = file_dir + '/ChildProduced' + str(age_list[i]) + '.json'
-                json.dump((tokens, lexemes), open(save, 'w'))
-            elif i > 0 and i < (len(age_list)-1):
-                tokens = []
-                lexemes = []
-                for a, t, l in zipped:
-                    if isinstance(a[0], int):
-                        if a[0] >= int(age_list[i-1]) and a[0] < int(age_list[i]):
-                            token_transcripts = [t]
-                            lexeme_transcripts = [l]
-                            for t, l in zip(token_transcripts, lexeme_transcripts):
-                                tokens.extend(t)  # this is now a list of utterances
-                                lexemes.extend(l) # this is now a list of corresponding lexemes to each utterance
-                save = file_dir + '/ChildProduced' + str(age_list[i]) + '.json'
-                json.dump((tokens, lexemes), open(save, 'w'))
-            elif i == (len(age_list)-1):
-                tokensMinus = []
-                lexemesMinus = []
-                tokensPlus = []
-                lexemesPlus = []
-                for a, t, l in zipped:
-                    if isinstance(a[0], int):
-                        if a[0] >= int(age_list[i-1]) and a[0] < int(age_list[i]):
-                            token_transcripts = [t]
-                            lexeme_transcripts = [l]
-                            for t, l in zip(token_transcripts, lexeme_transcripts):
-                                tokensMinus.extend(t)  # this is now a list of utterances
-                                lexemesMinus.extend(l) # this is now a list of corresponding lexemes to each utterance
-                        if a[0] >= int(age_list[i]):
-                            token_transcripts = [t]
-                            lexeme_transcripts = [l]
-                            for t, l in zip(token_transcripts, lexeme_transcripts):
-                                tokensPlus.extend(t)  # this is now a list of utterances
-                                lexemesPlus.extend(l) # this is now a list of corresponding lexemes to each utterance
-                saveMinus = file_dir + '/ChildProduced' + str(age_list[i]) + '.json'
-                json.dump((tokensMinus, lexemesMinus), open(saveMinus, 'w'))
-                savePlus = file_dir + '/ChildProduced' + str(age_list[i]) + 'Plus.json'
-                json.dump((tokensPlus, lexemesPlus), open(savePlus, 'w'))
+        return 0
+
+    return bisect_right(age_list, age)
+
+class ShardWriter:
+
+    """
+    Streams the utterances of an age bin to disk as they come, rather than collecting them in memory. Tokens and lexemes
+    are appended to two temporary files, which are joined when the writer is closed into the same (tokens, lexemes)
+    .json file json.dump would write
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.token_file = open(path + '.tokens.tmp', 'w')
+        self.lexeme_file = open(path + '.lexemes.tmp', 'w')
+        self.n_utterances = 0
+        self.n_lexeme_utterances = 0
+
+    def write(self, token_transcript, lexeme_transcript):
+        for tokens in token_transcript:
+            self.token_file.write((', ' if self.n_utterances else '') + json.dumps(tokens))
+            self.n_utterances += 1
+        for lexemes in lexeme_transcript:
+            self.lexeme_file.write((', ' if self.n_lexeme_utterances else '') + json.dumps(lexemes))
+            self.n_lexeme_utterances += 1
+
+    def close(self):
+        self.token_file.close()
+        self.lexeme_file.close()
+        with open(self.path, 'w') as out:
+            out.write('[[')
+            with open(self.path + '.tokens.tmp', 'r') as f:
+                shutil.copyfileobj(f, out)
+            out.write('], [')
+            with open(self.path + '.lexemes.tmp', 'r') as f:
+                shutil.copyfileobj(f, out)
+            out.write(']]')
+        os.remove(self.path + '.tokens.tmp')
+        os.remove(self.path + '.lexemes.tmp')
+
+def save_corpus_age_bins(file_dir, age_list, corpus):
+    
+    """
+    This is a function to split the raw corpus which was generated with process_and_save_corpus_data() according to the
+    age of the target child, into files of child directed speech (ChildDirected...json) and of child produced speech
+    (ChildProduced...json). Each file contains 2 lists: a list of all tokens, and a list of their corresponding lexemes
+    The corpus is read once: each transcript is routed to its age bin and its utterances are appended to the directed
+    and produced files of that bin, which are all written at the same time, so only one transcript is held in memory
+    Transcripts for which the age of the child is unknown are left out
+    """
+
+    writers = {
+        'directed': [ShardWriter(path) for path in age_bin_paths(file_dir, age_list, 'ChildDirected')],
+        'produced': [ShardWriter(path) for path in age_bin_paths(file_dir, age_list, 'ChildProduced')]
+    }
+
+    print("starting to dump the age bins")
+    for ages, tokens, lexemes, child_tokens, child_lexemes in iter_raw_transcripts(file_dir, corpus):
+        if isinstance(ages[0], int):
+            i = age_bin_index(ages[0], age_list)
+            writers['directed'][i].write(tokens, lexemes)    # appends the utterances and their corresponding lexemes
+            writers['produced'][i].write(child_tokens, child_lexemes)
+
+    for speech, bin_writers in writers.items():
+        for writer in bin_writers:
+            writer.close()
+            print("for child %s speech, dumped %s utterances to %s" % (speech, writer.n_utterances, writer.path))
     
     print("done dumping corpora")
 
@@ -457,6 +662,10 @@ if __name__ == '__main__':
         file3 = file2.replace('\\', '/')
         filelist2.append(file3)
 
-    #process_and_save_corpus_data(filelist2, file_dir, root_folder)
-    save_corpus_child_directed(file_dir, age_list, corpus='corpus_EN_child')
-    save_corpus_child_produced(file_dir, age_list, corpus='corpus_EN_child')
\ No newline at end of file
+    # the transcripts are extracted in parallel, one worker process per core
+    processes = os.cpu_count()
+
+    #process_and_save_corpus_data(filelist2, file_dir, root_folder, processes=processes)
+    # or, to only extract the transcripts which were added or changed since the raw corpus was last saved
+    #ingest_corpus_data(filelist2, file_dir, root_folder, processes=processes)
+    save_corpus_age_bins(file_dir, age_list, corpus='corpus_EN_child')
\ No newline at end of file
@@ -2,25 +2,35 @@ import json
 import numpy as np
 import os
 import pandas as pd
+from scipy import sparse
 from gensim.models.fasttext import FastText
 from gensim.models import Word2Vec
 from semspaces.space import SemanticSpace
 import space
 import nltk
+from NDL_semantic_vectors.rescorla_wagner.checkpoints import load_association_matrix
 
 #function to make NDL training data, consisting of two lists of the same tokens
-def make_NDL_training_data(filename_list):
+def make_NDL_training_data(filename_list, cumulative = True):
 
     #filelist is the list of .json files containing the extracted corpus data from the CHILDES corpus extracted with the corpus_reader code
+    #if cumulative is True, NDL_file_i.json contains the tokens of all files up to i, to be trained from scratch one by one
+    #if cumulative is False, NDL_bin_i.json only contains the tokens of file i, to be trained incrementally over all bins
+    #(see rescorla_wagner.age_bins in NDL_semantic_vectors), which costs a single pass over the corpus
 
     total = []
 
     filelist = sorted(os.listdir(filename_list))
 
-    for i in len(filelist):
+    for i in range(len(filelist)):
         with open(os.path.join(filename_list, filelist[i]), 'r') as file:
             data = json.load(file)
 
+        if not cumulative:
+            name = "NDL_bin_" + str(i) + ".json"
+            json.dump((data[0], data[0]), open(os.path.join(filename_list, name), 'w'))
+            continue
+
         for j in data[0]:
             total.append(j)
 
@@ -29,14 +39,50 @@ def make_NDL_training_data(filename_list):
     
     print("done")
 
-#function to make sparse NDL vectors
-def make_sparse_NDL_vectors(filename_list, cuename_list):
+#function to compute the variance (with ddof = 1, as pandas does) of each column of a matrix, reading it in chunks of
+#rows so that memory-mapped and sparse matrices never need to be held in memory as a whole
+def column_variances(matrix, chunk_size = 1000):
 
-    filelist = sorted(os.listdir(filename_list))
+    count = 0
+    mean = np.zeros(matrix.shape[1])
+    m2 = np.zeros(matrix.shape[1])
+
+    for start in range(0, matrix.shape[0], chunk_size):
+        chunk = matrix[start:start + chunk_size]
+        chunk = chunk.toarray() if sparse.issparse(chunk) else np.asarray(chunk, dtype = np.float64)
+
+        #merge the mean and sum of squared deviations of the chunk with those of the rows seen so far (Chan et al.)
+        n = chunk.shape[0]
+        chunk_mean = chunk.mean(axis = 0)
+        chunk_m2 = ((chunk - chunk_mean) ** 2).sum(axis = 0)
+        delta = chunk_mean - mean
+        total = count + n
+        mean += delta * n / total
+        m2 += chunk_m2 + delta ** 2 * count * n / total
+        count = total
+
+    return m2 / (count - 1)
+
+#function to get the indices of the k columns with the highest variance, in their original order
+def top_variance_columns(variances, k):
+
+    if len(variances) <= k:
+        return np.arange(len(variances))
+
+    threshold = np.sort(variances)[-(k + 1)]
+
+    return np.flatnonzero(variances > threshold)
+
+#function to make sparse NDL vectors: association matrices can be stored as .npy files, which are memory-mapped, or as
+#.npz files (see the 'sparse' and 'sparse_delta' checkpoint formats of the NDL trainer), which are read as scipy.sparse
+#matrices, and only the n_columns outcomes with the highest variance are kept
+def make_sparse_NDL_vectors(filename_list, cuename_list, n_columns = 4000, chunk_size = 1000):
+
+    filelist = sorted(f for f in os.listdir(filename_list) if f.endswith('.npy') or f.endswith('.npz'))
     cuelist = sorted(os.listdir(cuename_list))
 
-    for i in len(filelist):
-        numpy_array = np.load(os.path.join(filename_list, filelist[i]))
+    for i in range(len(filelist)):
+        matrix = load_association_matrix(os.path.join(filename_list, filelist[i]), dense = False, mmap_mode = 'r')
         with open(os.path.join(cuename_list, cuelist[i]), 'r') as file:
             cues = json.load(file)
 
@@ -44,54 +90,65 @@ def make_sparse_NDL_vectors(filename_list, cuename_list):
         for key in cues.keys():
             cueslist.append(key)
 
-        df = pd.DataFrame(numpy_array, index = cueslist, columns = cueslist)
-        variance = df.var()
-
-        sort = sorted(variance)
-        threshold = sort[-4001]
-        newdf = df.loc[:, df.var() > threshold]
+        columns = top_variance_columns(column_variances(matrix, chunk_size), n_columns)
 
         name = "NLD_vectors_" + str(i) + '.txt'
         with open(os.path.join(filename_list, name), 'w') as f:
-            f.write(str(newdf.shape[0]))
+            f.write(str(matrix.shape[0]))
             f.write(" ")
-            f.write(str(newdf.shape[1]))
+            f.write(str(len(columns)))
             f.write("\n")
             f.close()
-        newdf.to_csv(os.path.join(filename_list, name), index = True, header = False, sep = ' ', mode = 'a') 
+
+        #write the vectors in chunks of rows, keeping only the selected columns
+        for start in range(0, matrix.shape[0], chunk_size):
+            chunk = matrix[start:start + chunk_size]
+            chunk = chunk.toarray() if sparse.issparse(chunk) else np.asarray(chunk)
+            chunk_df = pd.DataFrame(chunk[:, columns], index = cueslist[start:start + chunk_size])
+            chunk_df.to_csv(os.path.join(filename_list, name), index = True, header = False, sep = ' ', mode = 'a')
+
+#function to list the trigrams of a word, with a # appended as start and end of word (as in Baayen)
+def word_trigrams(word, k = 3):
+
+    word = '#' + word + '#'
+    if word == '##':
+        word = '# #'
+
+    return [word[start: start + k] for start in range(len(word) - k + 1)]
+
+#function to make a sparse matrix of trigram counts, with one row per word and one column per trigram in trigram2id:
+#a cell is 1 if the trigram occurs in the word and 0 otherwise, trigrams missing from trigram2id are ignored
+def make_trigram_matrix(wordlist, trigram2id):
+
+    indptr = [0]
+    indices = []
+    for word in wordlist:
+        columns = sorted({trigram2id[ngram] for ngram in word_trigrams(word) if ngram in trigram2id})
+        indices.extend(columns)
+        indptr.append(len(indices))
+
+    return sparse.csr_matrix(
+        (np.ones(len(indices), dtype = np.int64), np.array(indices, dtype = np.int64), np.array(indptr, dtype = np.int64)),
+        shape = (len(wordlist), len(trigram2id))
+    )
 
 #function to make trigram word form vectors for use in the LDL algorithm
-def make_form_vectors(cuename_list):
+def make_form_vectors(cuename_list, chunk_size = 1000):
     
-    cuelist = sorted(os.listdir(cuename_list))
+    cuelist = sorted(f for f in os.listdir(cuename_list) if f.endswith('.json'))
 
-    #first create a list of all threegrams available in the corpus
+    #first map all threegrams available in the corpus to a column, in order of first occurrence
     with open(os.path.join(cuename_list, cuelist[-1]), 'r') as f:
         complete_cues = json.load(f)
 
-    complete_wordlist = []
-    for key in complete_cues.keys():
-        complete_wordlist.append(key)
-
-    complete_newlist = []
-    for word in complete_wordlist:
-        word = '#' + word + '#'
-        if word == '##':
-            word = '# #'
-        complete_newlist.append(word)
-        
-    #create a list of all threegrams
-    threegrams = []
-    k = 3
-    for word in complete_newlist:
-        for start in range(len(word)):
-            temp = word[start: start + k]
-            if len(temp) == k:
-                if temp not in threegrams:
-                    threegrams.append(temp)
+    trigram2id = {}
+    for word in complete_cues.keys():
+        for ngram in word_trigrams(word):
+            if ngram not in trigram2id:
+                trigram2id[ngram] = len(trigram2id)
 
     #for each part of the corpus, make formvectors specifying which threegrams are present in each word
-    for i in len(cuelist):
+    for i in range(len(cuelist)):
         with open(os.path.join(cuename_list, cuelist[i]), 'r') as file:
             cues = json.load(file)
 
@@ -99,24 +156,7 @@ def make_form_vectors(cuename_list):
         for key in cues.keys():
             wordlist.append(key)
 
-        #append a # as start and end of word (as in Baayen)
-        newlist = []
-        for word in wordlist:
-            word = '#' + word + '#'
-            if word == '##':
-                word = '# #'
-            newlist.append(word)
-
-        #create dataframe
-        d = pd.DataFrame(0, index=newlist, columns=threegrams)
-
-        #check if 3gram is in word, if yes, the corresponding cel will have 1 added to it
-        for word in newlist:
-            for ngram in threegrams:
-                if ngram in word:
-                    d.loc[word, ngram] += 1
-                    
-        d.set_axis(wordlist, axis='index', inplace = True)
+        d = make_trigram_matrix(wordlist, trigram2id)
 
         name = "Formvector" + str(i) + ".txt"
         with open(os.path.join(cuename_list, name), 'w') as f:
@@ -125,7 +165,11 @@ def make_form_vectors(cuename_list):
             f.write(str(d.shape[1]))
             f.write('\n')
             f.close()
-        d.to_csv(os.path.join(cuename_list, name), index = True, header = False, sep = ' ', mode = 'a')
+
+        #write the vectors in chunks of rows, so that only chunk_size dense rows are ever held in memory
+        for start in range(0, d.shape[0], chunk_size):
+            chunk_df = pd.DataFrame(d[start:start + chunk_size].toarray(), index = wordlist[start:start + chunk_size])
+            chunk_df.to_csv(os.path.join(cuename_list, name), index = True, header = False, sep = ' ', mode = 'a')
 
     print("done")
 